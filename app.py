@@ -1,23 +1,35 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import auth, credentials, firestore
-from components.mood_bot import render_mood_check_in
-from components.task_manager import render_task_manager
-from components.focus_mode import render_focus_mode
-from components.story_generator import render_story_generator
-from components.buddy_connect import render_buddy_connect
-from components.history_tracker import render_history_dashboard, update_user_history
-from datetime import datetime, timedelta
+
+# Page config must be the first Streamlit command, ahead of any warning
+# raised while config.py initializes Firebase
+st.set_page_config(
+    page_title="MindSpace",
+    page_icon="🧠",
+    layout="wide"
+)
+
+from firebase_admin import auth, firestore
+from datetime import datetime, timezone
+from google.api_core.exceptions import Conflict
+from google.api_core.retry import Retry, if_transient_error
 from config import (
     db,
-    is_firestore_available,
-    initialize_firebase,
     APP_NAME,
     APP_DESCRIPTION,
     EMERGENCY_CONTACTS,
+    MAX_LOCAL_HISTORY,
 )
 from services.storage_service import StorageService
-import json
+from services.write_buffer import BatchedWriter
+from services.background import KeyedExecutor
+from services.timestamps import now_ns
+import time
+import copy
+from collections import deque
+import hashlib
+import os
+import secrets
+import threading
 
 # Try to get FIREBASE_CONFIG, but don't fail if it's missing
 try:
@@ -25,68 +37,191 @@ try:
 except ImportError:
     FIREBASE_CONFIG = None
 
-# Initialize session state for user profiles
-if 'user_profiles' not in st.session_state:
-    st.session_state.user_profiles = {}
-
-# Initialize session state for local history storage
-if 'local_mood_history' not in st.session_state:
-    st.session_state.local_mood_history = []
-if 'local_focus_history' not in st.session_state:
-    st.session_state.local_focus_history = []
-if 'local_task_history' not in st.session_state:
-    st.session_state.local_task_history = []
+# Retry policy for commits that must not be lost to a transient 5xx/429
+TRANSIENT_RETRY = Retry(predicate=if_transient_error, deadline=30.0)
+
+# Session lists of entries not yet written to the user document, by field
+PENDING_HISTORY_FIELDS = {
+    'pending_chat_history': 'chat_history',
+    'pending_mood_history': 'mood_history',
+    'pending_focus_history': 'focus_history',
+    'pending_task_history': 'task_history',
+}
+
+# User document fields read at login; the mood, focus and task arrays are
+# loaded by the pages that chart them, not copied into every session
+LOGIN_FIELDS = ['email', 'name', 'created_at', 'chat_history']
+
+# Most recent chat turns kept in session state (pickled on every rerun)
+CHAT_HISTORY_LIMIT = 50
+
+# Per-user session keys dropped on logout so nothing carries over to the next login
+SESSION_USER_KEYS = frozenset({
+    'user_id', 'user_email', 'user_profile', 'history',
+    'chat_history', 'chat_prefix_anchor', 'chat_response_cache', 'mood_history', 'focus_history', 'task_history',
+    'local_mood_history', 'local_focus_history', 'local_task_history',
+    'signup_step', 'signup_name', 'signup_email', 'signup_password_hash', 'signup_password_salt',
+    'otp_email_future', 'auth_mode', 'stories', 'open_profile', 'schedule_cache', 'task_cursor', 'task_page_filters', 'task_prefetch', 'pending_task_updates', 'task_updates_queued_at', 'last_sync', 'sync_interval', 'sync_future',
+    'focus_active', 'focus_start_time', 'focus_duration', 'focus_task',
+    'tasks', 'next_task_id', 'profiles', 'connections', 'messages', 'buddy_state',
+    *PENDING_HISTORY_FIELDS,
+})
+
+# scrypt parameters for sign-up passwords; Firebase Auth imports the hash as-is
+SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1, 'dklen': 64}
+
+# Seconds between background syncs of local and Firestore data
+SYNC_INTERVAL_SECONDS = 5 * 60
+
+# Seconds before another sign-up code can be sent to the same email
+OTP_RESEND_SECONDS = 60
+
+# Session state defaults: signed-in user profile, local history storage and auth flow
+SESSION_DEFAULTS = {
+    'user_profile': None,
+    'local_mood_history': deque(maxlen=MAX_LOCAL_HISTORY),
+    'local_focus_history': deque(maxlen=MAX_LOCAL_HISTORY),
+    'local_task_history': deque(maxlen=MAX_LOCAL_HISTORY),
+    'user_id': None,
+    'auth_mode': "login",
+    'signup_step': 1,
+}
+
+# Initialize all missing keys with a single session state update
+missing_defaults = {
+    key: copy.copy(value)
+    for key, value in SESSION_DEFAULTS.items()
+    if key not in st.session_state
+}
+if missing_defaults:
+    st.session_state.update(missing_defaults)
 
 # Initialize UserHistory (assuming it's defined in your main app or a utils file)
 class UserHistory:
+    """Session mood check-ins, stored column-wise; only the newest MAX_LOCAL_HISTORY are kept"""
+    COLUMNS = ('timestamp', 'mood', 'user_message', 'ai_response')
+
     def __init__(self):
-        self.mood_log = []
+        self.columns = {name: deque(maxlen=MAX_LOCAL_HISTORY) for name in self.COLUMNS}
+        # Check-ins ever added; unlike the capped length it changes on every add
+        self.added = 0
+        # (added count, frame) from the last to_frame call
+        self._frame = (0, None)
 
     def add_mood_checkin(self, mood, user_message=None, ai_response=None):
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "mood": mood,
-            "user_message": user_message,
-            "ai_response": ai_response
-        }
-        self.mood_log.append(entry)
+        row = (now_ns(), mood, user_message, ai_response)
+        for name, value in zip(self.COLUMNS, row):
+            self.columns[name].append(value)
+        self.added += 1
 
     def get_history(self):
-        return self.mood_log
+        return [dict(zip(self.COLUMNS, row)) for row in zip(*self.columns.values())]
+
+    def to_frame(self):
+        """Typed DataFrame of the check-ins, rebuilt only after add_mood_checkin"""
+        if self._frame[1] is not None and self._frame[0] == self.added:
+            return self._frame[1]
+        import pandas as pd
+        frame = pd.DataFrame({
+            'timestamp': pd.to_datetime(pd.Series(list(self.columns['timestamp']), dtype='int64'), unit='ns', utc=True),
+            'mood': pd.Categorical(list(self.columns['mood'])),
+            'user_message': pd.Series(list(self.columns['user_message']), dtype=object),
+            'ai_response': pd.Series(list(self.columns['ai_response']), dtype=object),
+        })
+        self._frame = (self.added, frame)
+        return frame
 
 # Initialize history object
 if 'history' not in st.session_state:
     st.session_state.history = UserHistory()
 
+@st.cache_resource(show_spinner=False)
+def get_storage():
+    """One StorageService per process, sharing the cached Firestore client"""
+    return StorageService(db)
+
 # Initialize storage service
-storage_service = StorageService(db)
+storage_service = get_storage()
+
+@st.cache_resource(show_spinner=False)
+def get_write_buffer():
+    """Process-wide buffer that coalesces small user document writes"""
+    return BatchedWriter(db)
+
+@st.cache_resource(show_spinner=False)
+def get_sync_executor():
+    """Process-wide workers for syncing user data off the render thread"""
+    return KeyedExecutor(max_workers=4)
+
+@st.cache_resource(show_spinner=False)
+def get_otp_send_times():
+    """Process-wide {email: monotonic time of the last code sent} and the lock guarding it"""
+    return {}, threading.Lock()
+
+def request_otp(email):
+    """Send a sign-up code to email at most once per OTP_RESEND_SECONDS; True if one is on its way"""
+    sent_at, lock = get_otp_send_times()
+    with lock:
+        last = sent_at.get(email)
+        if last is not None and time.monotonic() - last < OTP_RESEND_SECONDS:
+            # The code sent moments ago is still valid
+            return True
+        if not storage_service.send_otp(email):
+            return False
+        sent_at[email] = time.monotonic()
+        return True
+
+def forget_otp_request(email):
+    """Allow an immediate resend once the stored code has been used up"""
+    sent_at, lock = get_otp_send_times()
+    with lock:
+        sent_at.pop(email, None)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_user_doc(user_id):
+    """Load the login fields of a user document from Firestore, cached across reruns"""
+    doc = db.collection('users').document(user_id).get(field_paths=LOGIN_FIELDS)
+    return doc.to_dict() if doc.exists else None
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def batch_get_users(emails):
+    """Look up Firebase Auth users by email in one batched request (max 100)"""
+    result = auth.get_users([auth.EmailIdentifier(email) for email in emails])
+    return {user.email.lower(): user for user in result.users}
 
 def get_user_profile(user_id):
-    """Get user profile from session state"""
-    return st.session_state.user_profiles.get(user_id)
+    """Get the signed-in user's profile from session state"""
+    profile = st.session_state.user_profile
+    if profile and profile.get('uid') == user_id:
+        return profile
+    return None
 
 def update_user_profile(user_id, profile_data):
-    """Update user profile in session state"""
-    st.session_state.user_profiles[user_id] = profile_data
+    """Update the signed-in user's profile in session state"""
+    st.session_state.user_profile = {'uid': user_id, **profile_data}
     return True
 
 def handle_login(email, password):
     """Handle user login"""
     try:
-        user = auth.get_user_by_email(email)
+        user = batch_get_users((email,)).get(email.lower())
+        if user is None:
+            raise auth.UserNotFoundError(f"No user record found for the provided email: {email}.")
         st.session_state.user_id = user.uid
         st.session_state.user_email = user.email
         
-        # Initialize or fetch user data from Firestore
-        user_ref = db.collection('users').document(user.uid)
-        user_doc = user_ref.get()
+        # Fetch user data through the cache; Firestore is only hit on a miss
+        user_data = load_user_doc(user.uid)
+        name = (user_data or {}).get('name') or user.display_name or email.partition('@')[0]
         
-        if not user_doc.exists:
+        if user_data is None:
             # Create new user document if it doesn't exist
+            user_ref = db.collection('users').document(user.uid)
+            # Timestamps are filled in server-side
             initial_data = {
                 'email': email,
-                'name': email.split('@')[0],
-                'created_at': datetime.now().isoformat(),
+                'name': name,
+                'created_at': firestore.SERVER_TIMESTAMP,
                 'mood_history': [],
                 'focus_history': [],
                 'task_history': [],
@@ -95,60 +230,80 @@ def handle_login(email, password):
                     'theme': 'light',
                     'notifications_enabled': True
                 },
-                'last_login': datetime.now().isoformat()
-            }
-            user_ref.set(initial_data)
-            # Set user profile in session state
-            st.session_state.user_profiles[user.uid] = {
-                'email': email,
-                'name': email.split('@')[0],
-                'created_at': initial_data['created_at']
+                'last_login': firestore.SERVER_TIMESTAMP
             }
+            try:
+                # create() refuses to overwrite, so a login racing in another
+                # tab can't clobber a document that was just written
+                user_ref.create(initial_data)
+                load_user_doc.clear()
+            except Conflict:
+                load_user_doc.clear()
+                user_data = load_user_doc(user.uid)
+
+        if user_data is None:
+            created_at = datetime.now(timezone.utc)
             # Initialize session state with empty data
-            for key in ['chat_history', 'mood_history', 'focus_history', 'task_history']:
-                st.session_state[key] = []
+            st.session_state.chat_history = []
         else:
-            # Load existing data into session state
-            user_data = user_doc.to_dict()
-            st.session_state.user_profile = {
-                'email': user_data.get('email'),
-                'name': user_data.get('name'),
-                'created_at': user_data.get('created_at')
-            }
-            # Set user profile in session state
-            st.session_state.user_profiles[user.uid] = {
-                'email': user_data.get('email'),
-                'name': user_data.get('name'),
-                'created_at': user_data.get('created_at')
-            }
+            created_at = user_data.get('created_at')
             # Update session state with user data
-            st.session_state.chat_history = user_data.get('chat_history', [])
-            st.session_state.mood_history = user_data.get('mood_history', [])
-            st.session_state.focus_history = user_data.get('focus_history', [])
-            st.session_state.task_history = user_data.get('task_history', [])
-            # Update last login
-            user_ref.update({'last_login': datetime.now().isoformat()})
+            st.session_state.chat_history = user_data.get('chat_history', [])[-CHAT_HISTORY_LIMIT:]
+            # Queue the last login update; it is committed with other pending writes
+            get_write_buffer().update('users', user.uid, {'last_login': firestore.SERVER_TIMESTAMP})
+
+        # One profile per session; the display name is resolved once here
+        st.session_state.user_profile = {
+            'uid': user.uid,
+            'email': user.email,
+            'name': name,
+            'created_at': created_at
+        }
         
         return True
+    except auth.UserNotFoundError:
+        st.error("Login failed: no account exists for this email.")
+        return False
     except Exception as e:
         st.error(f"Login failed: {e}")
         return False
 
-def handle_signup(email, password, name):
+def hash_password(password):
+    """Hash a sign-up password with scrypt; returns (hash, salt)"""
+    salt = os.urandom(16)
+    return hashlib.scrypt(password.encode(), salt=salt, **SCRYPT_PARAMS), salt
+
+def handle_signup(email, password_hash, password_salt, name):
     """Handle user signup after OTP verification"""
     try:
-        # Create user in Firebase
-        user = auth.create_user(
-            email=email,
-            password=password,
-            display_name=name
+        # Import the user with the scrypt hash so the plaintext password
+        # never has to be kept between the signup steps
+        uid = secrets.token_urlsafe(21)
+        result = auth.import_users(
+            [auth.ImportUserRecord(
+                uid=uid,
+                email=email,
+                display_name=name,
+                password_hash=password_hash,
+                password_salt=password_salt
+            )],
+            hash_alg=auth.UserImportHash.standard_scrypt(
+                memory_cost=SCRYPT_PARAMS['n'],
+                parallelization=SCRYPT_PARAMS['p'],
+                block_size=SCRYPT_PARAMS['r'],
+                derived_key_length=SCRYPT_PARAMS['dklen']
+            )
         )
+        if result.failure_count:
+            raise ValueError(result.errors[0].reason)
+        # A lookup cached before signup would still report the email as unknown
+        batch_get_users.clear()
 
-        # Create user profile in Firestore
-        db.collection('users').document(user.uid).set({
+        # Create user profile in Firestore; timestamps are filled in server-side
+        db.collection('users').document(uid).set({
             'email': email,
             'name': name,
-            'created_at': datetime.now().isoformat(),
+            'created_at': firestore.SERVER_TIMESTAMP,
             'mood_history': [],
             'focus_history': [],
             'task_history': [],
@@ -161,8 +316,8 @@ def handle_signup(email, password, name):
             'profile': {
                 'name': name,
                 'email': email,
-                'joined_date': datetime.now().isoformat(),
-                'last_login': datetime.now().isoformat()
+                'joined_date': firestore.SERVER_TIMESTAMP,
+                'last_login': firestore.SERVER_TIMESTAMP
             }
         })
 
@@ -171,33 +326,239 @@ def handle_signup(email, password, name):
         st.error(f"Signup failed: {e}")
         return False
 
+def flush_pending_history(user_id, updates=None):
+    """Append entries added this session to the user document as deltas"""
+    updates = dict(updates or {})
+    flushed = []
+    for pending_key, field in PENDING_HISTORY_FIELDS.items():
+        entries = st.session_state.get(pending_key)
+        if entries:
+            updates[field] = firestore.ArrayUnion(list(entries))
+            flushed.append(pending_key)
+
+    # Nothing new since the last flush: skip the RPC entirely
+    if not updates:
+        return
+
+    batch = db.batch()
+    batch.update(db.collection('users').document(user_id), updates)
+    batch.commit(retry=TRANSIENT_RETRY)
+    for pending_key in flushed:
+        st.session_state[pending_key] = []
+    storage_service.invalidate_history(user_id)
+    # The login cache only holds LOGIN_FIELDS; other writes can't make it stale
+    if not updates.keys().isdisjoint(LOGIN_FIELDS):
+        load_user_doc.clear()
+
+def flush_task_updates(user_id):
+    """Write task status changes still queued by the task manager"""
+    if st.session_state.get('pending_task_updates'):
+        from components.task_manager import write_task_updates
+        write_task_updates(storage_service, user_id)
+
 def handle_logout():
     """Handle user logout and cleanup"""
     try:
-        # Save all session data to Firestore before clearing
+        # Save new session data to Firestore before clearing
         if st.session_state.user_id:
-            doc_ref = db.collection('users').document(st.session_state.user_id)
-            doc_ref.update({
-                'chat_history': st.session_state.get('chat_history', []),
-                'mood_history': st.session_state.get('local_mood_history', []),
-                'focus_history': st.session_state.get('local_focus_history', []),
-                'task_history': st.session_state.get('local_task_history', [])
-            })
+            # Fold any queued writes for this user (e.g. last_login) into the same commit
+            flush_task_updates(st.session_state.user_id)
+            flush_pending_history(
+                st.session_state.user_id,
+                get_write_buffer().pop('users', st.session_state.user_id)
+            )
     except Exception as e:
         st.warning(f"Failed to save data during logout: {str(e)}")
     finally:
-        # Clear session state
-        for key in ['user_id', 'chat_history', 'local_mood_history', 
-                   'local_focus_history', 'local_task_history']:
-            if key in st.session_state:
-                del st.session_state[key]
+        # Clear session state; defaults are restored on the next run
+        for key in SESSION_USER_KEYS & st.session_state.keys():
+            del st.session_state[key]
+
+# Page renderers import their component on first use, so a session only
+# pays for the modules (LLM clients, plotting) of the pages it visits
+def render_mood_page():
+    from components.mood_bot import render_mood_check_in
+    render_mood_check_in(storage_service)
+
+def render_task_page():
+    from components.task_manager import render_task_manager
+    render_task_manager(storage_service)
+
+def render_focus_page():
+    from components.focus_mode import render_focus_mode
+    render_focus_mode(storage_service)
+
+def render_story_page():
+    from components.story_generator import render_story_generator
+    render_story_generator()
+
+def render_history_page():
+    from components.history_tracker import render_history_dashboard
+    render_history_dashboard(storage_service, st.session_state.user_id)
+
+def render_buddy_page():
+    from components.buddy_connect import render_buddy_connect
+    render_buddy_connect(storage_service, st.session_state.user_id)
+
+PAGES = {
+    "Mood Bot": render_mood_page,
+    "Task Manager": render_task_page,
+    "Focus Mode": render_focus_page,
+    "Story Generator": render_story_page,
+    "History": render_history_page,
+    "Buddy Connect": render_buddy_page
+}
+PAGE_NAMES = tuple(PAGES)
+
+def set_auth_mode(mode):
+    """Switch between the login and register forms"""
+    st.session_state.auth_mode = mode
+
+def reset_signup_step():
+    """Return to the first signup step"""
+    st.session_state.signup_step = 1
 
-def render_auth():
-    """Render authentication forms"""
-    tab1, tab2 = st.tabs(["Login", "Sign Up"])
+def init_sync_state():
+    if 'last_sync' not in st.session_state:
+        st.session_state.last_sync = time.monotonic()
+    if 'sync_interval' not in st.session_state:
+        st.session_state.sync_interval = SYNC_INTERVAL_SECONDS
 
-    with tab1:
-        with st.form("login_form"):
+def check_and_sync_data():
+    """Check if it's time to sync data and perform sync if needed"""
+    # Report the outcome of the last background sync, which can't write to the page itself
+    future = st.session_state.get('sync_future')
+    if future is not None and future.done():
+        st.session_state.sync_future = None
+        if future.exception() is not None or not future.result():
+            if storage_service.is_firestore_available():
+                st.warning("Couldn't sync your data with the cloud; it will be retried.")
+    if time.monotonic() - st.session_state.last_sync > st.session_state.sync_interval:
+        if st.session_state.get('user_id'):
+            try:
+                flush_task_updates(st.session_state.user_id)
+                flush_pending_history(st.session_state.user_id)
+            except Exception as e:
+                st.warning(f"Error syncing data: {str(e)}")
+            # Run the sync in the background; a sync already in flight for
+            # this user is reused instead of starting another
+            st.session_state.sync_future = get_sync_executor().submit(
+                ('sync', st.session_state.user_id),
+                storage_service.sync_user_data,
+                st.session_state.user_id
+            )
+            st.session_state.last_sync = time.monotonic()
+
+def render_signup_step1():
+    """Collect account details and send the verification code"""
+    with st.form("signup_form", clear_on_submit=True):
+        st.subheader("✨ Create Account")
+        name = st.text_input("Full Name")
+        email = st.text_input("Email")
+        password = st.text_input("Password", type="password")
+        confirm_password = st.text_input("Confirm Password", type="password")
+        
+        # Add password requirements info
+        st.markdown("""
+        **Password Requirements:**
+        - At least 6 characters long
+        - Combination of letters and numbers recommended
+        """)
+        
+        submitted = st.form_submit_button("Register")
+
+        if submitted:
+            if not all([name, email, password, confirm_password]):
+                st.error("Please fill in all fields.")
+            elif password != confirm_password:
+                st.error("Passwords do not match.")
+            elif len(password) < 6:
+                st.error("Password must be at least 6 characters long.")
+            else:
+                with st.spinner("Sending verification code..."):
+                    # Store registration details in session state
+                    st.session_state.signup_name = name
+                    st.session_state.signup_email = email
+                    password_hash, password_salt = hash_password(password)
+                    st.session_state.signup_password_hash = password_hash
+                    st.session_state.signup_password_salt = password_salt
+                    
+                    # Send OTP
+                    if request_otp(email):
+                        st.session_state.signup_step = 2
+                        st.success("Verification code sent!")
+                        st.rerun(scope="fragment")
+                    else:
+                        st.error("Failed to send verification code. Please try again.")
+
+def render_signup_step2():
+    """Verify the emailed code and create the account"""
+    st.subheader("📧 Email Verification")
+    st.info(f"A verification code has been sent to {st.session_state.signup_email}")
+    if not storage_service.check_otp_delivery():
+        # Nothing arrived, so Resend has to send again
+        forget_otp_request(st.session_state.signup_email)
+    
+    with st.form("otp_verification"):
+        otp_input = st.text_input("Enter Verification Code")
+        
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            resend = st.form_submit_button("Resend Code")
+        with col2:
+            verify = st.form_submit_button("Verify")
+        
+        if resend:
+            with st.spinner("Resending verification code..."):
+                if request_otp(st.session_state.signup_email):
+                    st.success("New verification code sent!")
+                else:
+                    st.error("Failed to send verification code. Please try again.")
+        
+        if verify:
+            with st.spinner("Verifying..."):
+                if storage_service.verify_otp(st.session_state.signup_email, otp_input):
+                    # verify_otp deleted the stored code, so a resend must send a new one
+                    forget_otp_request(st.session_state.signup_email)
+                    if handle_signup(
+                        st.session_state.signup_email,
+                        st.session_state.signup_password_hash,
+                        st.session_state.signup_password_salt,
+                        st.session_state.signup_name
+                    ):
+                        # Clear signup session state; the step and mode are reset
+                        # rather than deleted since a fragment rerun skips the
+                        # session defaults at the top of the script
+                        for key in ['signup_email', 'signup_password_hash', 'signup_password_salt', 'signup_name', 'otp_email_future']:
+                            if key in st.session_state:
+                                del st.session_state[key]
+                        st.success("Account created successfully! Please log in.")
+                        st.session_state.signup_step = 1
+                        st.session_state.auth_mode = "login"
+                        st.rerun(scope="fragment")
+                else:
+                    st.error("Invalid verification code. Please try again.")
+
+    st.button("← Back", on_click=reset_signup_step)
+
+@st.fragment
+def render_auth():
+    """Login and registration forms; widget changes rerun only this fragment"""
+    # Create two columns for login and register buttons
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.button("🔑 Login", use_container_width=True,
+                  on_click=set_auth_mode, args=("login",))
+            
+    with col2:
+        st.button("✨ Register", use_container_width=True,
+                  on_click=set_auth_mode, args=("register",))
+    
+    # Display the appropriate form based on auth_mode
+    if st.session_state.auth_mode == "login":
+        with st.form("login_form", clear_on_submit=True):
+            st.subheader("🔑 Login")
             email = st.text_input("Email")
             password = st.text_input("Password", type="password")
             submitted = st.form_submit_button("Login")
@@ -206,263 +567,41 @@ def render_auth():
                 if handle_login(email, password):
                     st.success("Login successful!")
                     st.rerun()
-
-    with tab2:
-        if 'signup_step' not in st.session_state:
-            st.session_state.signup_step = 1
-
-        if st.session_state.signup_step == 1:
-            # Step 1: Collect user information
-            with st.form("signup_form"):
-                name = st.text_input("Full Name")
-                email = st.text_input("Email")
-                password = st.text_input("Password", type="password")
-                confirm_password = st.text_input("Confirm Password", type="password")
-                submitted = st.form_submit_button("Register")
-
-                if submitted:
-                    if not all([name, email, password, confirm_password]):
-                        st.error("Please fill in all fields.")
-                    elif password != confirm_password:
-                        st.error("Passwords do not match.")
-                    elif len(password) < 6:
-                        st.error("Password must be at least 6 characters long.")
-                    else:
-                        # Store registration details in session state
-                        st.session_state.signup_name = name
-                        st.session_state.signup_email = email
-                        st.session_state.signup_password = password
-                        
-                        # Send OTP
-                        otp = storage_service.send_otp(email)
-                        if otp:
-                            st.session_state.signup_step = 2
-                            st.rerun()
-                        else:
-                            st.error("Failed to send OTP. Please try again.")
-
-        elif st.session_state.signup_step == 2:
-            # Step 2: OTP Verification
-            st.subheader("Email Verification")
-            st.info(f"OTP has been sent to {st.session_state.signup_email}")
+                    
+        # Add a link to switch to registration
+        st.button("Don't have an account? Register here",
+                  on_click=set_auth_mode, args=("register",))
             
-            with st.form("otp_verification"):
-                otp_input = st.text_input("Enter OTP")
-                resend_col, verify_col = st.columns([1, 2])
-                
-                with resend_col:
-                    if st.form_submit_button("Resend OTP"):
-                        otp = storage_service.send_otp(st.session_state.signup_email)
-                        if otp:
-                            st.success("New OTP sent!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to send OTP. Please try again.")
-                
-                with verify_col:
-                    if st.form_submit_button("Verify OTP"):
-                        if storage_service.verify_otp(st.session_state.signup_email, otp_input):
-                            # Create user account
-                            if handle_signup(
-                                st.session_state.signup_email,
-                                st.session_state.signup_password,
-                                st.session_state.signup_name
-                            ):
-                                # Clear signup session state
-                                for key in ['signup_step', 'signup_email', 'signup_password', 'signup_name']:
-                                    if key in st.session_state:
-                                        del st.session_state[key]
-                                st.success("Account created successfully! Please log in.")
-                                st.rerun()
-                        else:
-                            st.error("Invalid OTP. Please try again.")
-
-            if st.button("← Back"):
-                st.session_state.signup_step = 1
-                st.rerun()
-
-def init_sync_state():
-    if 'last_sync' not in st.session_state:
-        st.session_state.last_sync = datetime.now()
-    if 'sync_interval' not in st.session_state:
-        st.session_state.sync_interval = timedelta(minutes=5)
+    else:  # Register mode
+        if st.session_state.signup_step == 1:
+            render_signup_step1()
+        else:
+            render_signup_step2()
 
-def check_and_sync_data():
-    """Check if it's time to sync data and perform sync if needed"""
-    if datetime.now() - st.session_state.last_sync > st.session_state.sync_interval:
-        if st.session_state.get('user_id'):
-            storage_service.sync_user_data(st.session_state.user_id)
-            st.session_state.last_sync = datetime.now()
+        # Add a link to switch to login
+        st.button("Already have an account? Login here",
+                  on_click=set_auth_mode, args=("login",))
 
 def main():
-    st.set_page_config(
-        page_title="MindSpace",
-        page_icon="🧠",
-        layout="wide"
-    )
-
     # Sidebar for navigation
     st.sidebar.title("🧠 MindSpace")
 
     # Authentication
-    if 'user_id' not in st.session_state:
-        st.session_state.user_id = None
-
     if st.session_state.user_id is None:
-        # Create two columns for login and register buttons
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("🔑 Login", use_container_width=True):
-                st.session_state.auth_mode = "login"
-                
-        with col2:
-            if st.button("✨ Register", use_container_width=True):
-                st.session_state.auth_mode = "register"
-        
-        # Initialize auth_mode if not exists
-        if 'auth_mode' not in st.session_state:
-            st.session_state.auth_mode = "login"
-            
-        # Display the appropriate form based on auth_mode
-        if st.session_state.auth_mode == "login":
-            with st.form("login_form"):
-                st.subheader("🔑 Login")
-                email = st.text_input("Email")
-                password = st.text_input("Password", type="password")
-                submitted = st.form_submit_button("Login")
-
-                if submitted and email and password:
-                    if handle_login(email, password):
-                        st.success("Login successful!")
-                        st.rerun()
-                        
-            # Add a link to switch to registration
-            if st.button("Don't have an account? Register here"):
-                st.session_state.auth_mode = "register"
-                st.rerun()
-                
-        else:  # Register mode
-            if 'signup_step' not in st.session_state:
-                st.session_state.signup_step = 1
-
-            if st.session_state.signup_step == 1:
-                with st.form("signup_form"):
-                    st.subheader("✨ Create Account")
-                    name = st.text_input("Full Name")
-                    email = st.text_input("Email")
-                    password = st.text_input("Password", type="password")
-                    confirm_password = st.text_input("Confirm Password", type="password")
-                    
-                    # Add password requirements info
-                    st.markdown("""
-                    **Password Requirements:**
-                    - At least 6 characters long
-                    - Combination of letters and numbers recommended
-                    """)
-                    
-                    submitted = st.form_submit_button("Register")
-
-                    if submitted:
-                        if not all([name, email, password, confirm_password]):
-                            st.error("Please fill in all fields.")
-                        elif password != confirm_password:
-                            st.error("Passwords do not match.")
-                        elif len(password) < 6:
-                            st.error("Password must be at least 6 characters long.")
-                        else:
-                            with st.spinner("Sending verification code..."):
-                                # Store registration details in session state
-                                st.session_state.signup_name = name
-                                st.session_state.signup_email = email
-                                st.session_state.signup_password = password
-                                
-                                # Send OTP
-                                otp = storage_service.send_otp(email)
-                                if otp:
-                                    st.session_state.signup_step = 2
-                                    st.success("Verification code sent!")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to send verification code. Please try again.")
-
-            elif st.session_state.signup_step == 2:
-                st.subheader("📧 Email Verification")
-                st.info(f"A verification code has been sent to {st.session_state.signup_email}")
-                
-                with st.form("otp_verification"):
-                    otp_input = st.text_input("Enter Verification Code")
-                    
-                    col1, col2 = st.columns([1, 1])
-                    with col1:
-                        resend = st.form_submit_button("Resend Code")
-                    with col2:
-                        verify = st.form_submit_button("Verify")
-                    
-                    if resend:
-                        with st.spinner("Resending verification code..."):
-                            otp = storage_service.send_otp(st.session_state.signup_email)
-                            if otp:
-                                st.success("New verification code sent!")
-                                st.rerun()
-                            else:
-                                st.error("Failed to send verification code. Please try again.")
-                    
-                    if verify:
-                        with st.spinner("Verifying..."):
-                            if storage_service.verify_otp(st.session_state.signup_email, otp_input):
-                                if handle_signup(
-                                    st.session_state.signup_email,
-                                    st.session_state.signup_password,
-                                    st.session_state.signup_name
-                                ):
-                                    # Clear signup session state
-                                    for key in ['signup_step', 'signup_email', 'signup_password', 'signup_name', 'auth_mode']:
-                                        if key in st.session_state:
-                                            del st.session_state[key]
-                                    st.success("Account created successfully! Please log in.")
-                                    st.session_state.auth_mode = "login"
-                                    st.rerun()
-                            else:
-                                st.error("Invalid verification code. Please try again.")
-
-                if st.button("← Back"):
-                    st.session_state.signup_step = 1
-                    st.rerun()
-                    
-            # Add a link to switch to login
-            if st.button("Already have an account? Login here"):
-                st.session_state.auth_mode = "login"
-                st.rerun()
+        render_auth()
     else:
-        user_profile = st.session_state.user_profiles.get(st.session_state.user_id)
-        if user_profile:
-            st.sidebar.success(f"Logged in as {user_profile.get('name', user_profile.get('email', 'User'))}")
-        else:
-            # fallback if profile is missing
-            st.sidebar.success(f"Logged in as {st.session_state.get('user_email', 'User')}")
-        if st.sidebar.button("Logout"):
-            handle_logout()
-            st.rerun()
+        st.sidebar.success(f"Logged in as {st.session_state.user_profile['name']}")
+        st.sidebar.button("Logout", on_click=handle_logout)
 
     # Add database status indicator in sidebar
-    if is_firestore_available():
+    if storage_service.is_firestore_available():
         st.sidebar.success("📊 Database: Connected")
     else:
         st.sidebar.warning("📊 Database: Using Local Storage")
         st.sidebar.info("Your data will be stored locally until database connection is restored")
 
     # Navigation
-    pages = {
-        "Mood Bot": lambda: render_mood_check_in(storage_service),
-        "Task Manager": lambda: render_task_manager(storage_service),
-        "Focus Mode": lambda: render_focus_mode(storage_service),
-        "Story Generator": render_story_generator,
-        "History": lambda: render_history_dashboard(storage_service, st.session_state.user_id),
-        "Buddy Connect": lambda: render_buddy_connect(storage_service, st.session_state.user_id)
-    }
-
-    selected_page = st.sidebar.radio("Go to", list(pages.keys()))
+    selected_page = st.sidebar.radio("Go to", PAGE_NAMES)
 
     # Main content
     st.title("MindSpace - Your Mental Wellness Companion")
@@ -475,10 +614,7 @@ def main():
     check_and_sync_data()
 
     # Render selected page
-    if pages[selected_page]:
-        pages[selected_page]()
-    else:
-        st.info(f"The '{selected_page}' feature is under development.")
+    PAGES[selected_page]()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,128 @@
 import streamlit as st
-from datetime import datetime
-import firebase_admin
 from firebase_admin import firestore
 from config import db
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from html import escape
+from operator import or_
+
+# Interests offered in the profile form, and their bit in interest masks
+BUDDY_INTERESTS = [
+    "Technology", "Art", "Music", "Sports",
+    "Reading", "Gaming", "Fitness", "Cooking",
+    "Travel", "Movies", "Science", "Writing"
+]
+INTEREST_BITS = {name: 1 << i for i, name in enumerate(BUDDY_INTERESTS)}
+
+if hasattr(np, 'bitwise_count'):
+    # NumPy 2 maps this to the CPU's POPCNT instruction
+    def popcount(masks):
+        return np.bitwise_count(masks).astype(np.float32)
+else:
+    _POPCOUNT_TABLE = np.array(
+        [mask.bit_count() for mask in range(1 << len(BUDDY_INTERESTS))],
+        dtype=np.float32
+    )
+
+    def popcount(masks):
+        return _POPCOUNT_TABLE[masks]
+
+# Mood scale used for compatibility (1 for the same mood, 0 for opposites)
+MOOD_SCORES = {
+    'Very Positive': 2,
+    'Positive': 1,
+    'Neutral': 0,
+    'Negative': -1,
+    'Very Negative': -2
+}
+MAX_MOOD_DIFF = 4
+
+def pack_interests(interests):
+    """Bitmask of the form interests in a list"""
+    return reduce(or_, (INTEREST_BITS.get(name, 0) for name in interests), 0)
+
+def unpack_interests(mask):
+    """Interest names set in a bitmask"""
+    return [name for name, bit in INTEREST_BITS.items() if mask & bit]
+
+def latest_mood_score(mood_history):
+    """Score of the most recent mood, or NaN if there is none"""
+    if not mood_history or not mood_history[-1].get('mood'):
+        return np.nan
+    return MOOD_SCORES.get(mood_history[-1]['mood'], 0)
+
+@st.cache_resource(ttl=600, show_spinner=False)
+def load_interest_matrix():
+    """Ids, interest masks, latest mood scores and buddy flags for all users"""
+    ids, masks, moods, connected = [], [], [], []
+    users = (
+        db.collection('users')
+        .select(['interests', 'mood_history', 'buddy_connected'])
+        .stream()
+    )
+    for user in users:
+        data = user.to_dict()
+        ids.append(user.id)
+        masks.append(pack_interests(data.get('interests', [])))
+        moods.append(latest_mood_score(data.get('mood_history')))
+        connected.append(bool(data.get('buddy_connected')))
+    return (
+        np.array(ids, dtype=object),
+        np.array(masks, dtype=np.uint16),
+        np.array(moods, dtype=np.float32),
+        np.array(connected, dtype=bool)
+    )
+
+# Chat bubbles, filled per message and sent to the frontend as one block
+SELF_MESSAGE_HTML = (
+    "<div style='text-align: right;'><small>{time}</small><br>"
+    "<div style='background-color: #1f618d; padding: 10px; border-radius: 10px; display: inline-block;'>"
+    "{content}</div></div>"
+)
+OTHER_MESSAGE_HTML = (
+    "<div style='text-align: left;'><small>{time}</small><br>"
+    "<div style='background-color: #2c3e50; padding: 10px; border-radius: 10px; display: inline-block;'>"
+    "{content}</div></div>"
+)
+
+# Overlaps the chat lookup with the buddy profile read
+_LOOKUP_POOL = ThreadPoolExecutor(max_workers=2)
+
+def find_chat_id(user_id):
+    """Id of the chat a user takes part in, or None"""
+    chat_query = (
+        db.collection('chats')
+        .where('participants', 'array_contains', user_id)
+        .limit(1)
+        .stream()
+    )
+    chat = next(chat_query, None)
+    return chat.id if chat else None
+
+# Seconds a cached profile may be served; a locally saved profile overrides
+# the cache for this long so its own writes are never shown stale
+PROFILE_TTL = 30
+
+@st.cache_data(ttl=PROFILE_TTL, show_spinner=False)
+def load_profile(user_id):
+    """Read a user document, cached across reruns until a buddy write clears it"""
+    user = db.collection('users').document(user_id).get()
+    return user.to_dict() if user.exists else None
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_chat_messages(chat_id, limit):
+    """Read a chat's latest messages, oldest first, cached across reruns"""
+    messages = (
+        db.collection('chats')
+        .document(chat_id)
+        .collection('messages')
+        .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .limit(limit)
+        .stream()
+    )
+    return [msg.to_dict() for msg in messages][::-1]
 
 class BuddySystem:
     def __init__(self):
@@ -12,6 +130,7 @@ class BuddySystem:
             st.session_state.buddy_state = {
                 'current_chat': None,
                 'chat_history': [],
+                'last_ts': None,
                 'last_refresh': None
             }
 
@@ -21,131 +140,85 @@ class BuddySystem:
             return None
             
         try:
-            user_ref = db.collection('users').document(user_id)
-            user = user_ref.get()
-            return user.to_dict() if user.exists else None
+            return load_profile(user_id)
         except Exception as e:
             st.error(f"Error retrieving user profile: {e}")
             return None
 
-    def find_matches(self, user_id, limit=5):
+    def find_matches(self, user_id, limit=5, current_user=None):
         """Find potential buddy matches based on interests and mood"""
         if not db:
             return []
             
         try:
-            # Get current user's profile
-            current_user = self.get_user_profile(user_id)
+            # Get current user's profile unless the caller already has it
+            current_user = current_user or self.get_user_profile(user_id)
             if not current_user:
                 return []
             
-            # Get all users
-            users = db.collection('users').stream()
-            matches = []
+            query = pack_interests(current_user.get('interests', []))
+            if not query:
+                return []
             
-            for user in users:
-                other_user = user.to_dict()
-                if user.id != user_id and not other_user.get('buddy_connected'):
-                    # Calculate interest similarity
-                    similarity = self._calculate_similarity(
-                        current_user.get('interests', []),
-                        other_user.get('interests', [])
-                    )
-                    
-                    # Calculate mood compatibility
-                    mood_match = self._check_mood_compatibility(
-                        current_user.get('mood_history', []),
-                        other_user.get('mood_history', [])
-                    )
-                    
-                    # Combined score
-                    match_score = (similarity * 0.7) + (mood_match * 0.3)
-                    
-                    matches.append({
-                        'user_id': user.id,
-                        'score': match_score,
-                        'interests': other_user.get('interests', [])
-                    })
+            # Score every user at once against the cached interest matrix
+            ids, masks, moods, connected = load_interest_matrix()
+            # Cosine of binary vectors: popcount(a & b) / sqrt(popcount(a) * popcount(b))
+            shared = popcount(masks & query)
+            similarity = shared / (np.sqrt(popcount(masks) * query.bit_count()) + 1e-9)
+            
+            own_mood = latest_mood_score(current_user.get('mood_history'))
+            mood_match = 1 - np.abs(moods - own_mood) / MAX_MOOD_DIFF
+            mood_match = np.where(np.isnan(mood_match), 0.5, mood_match)  # Neutral if no mood
             
-            # Sort by match score and return top matches
-            matches.sort(key=lambda x: x['score'], reverse=True)
-            return matches[:limit]
+            scores = similarity * 0.7 + mood_match * 0.3
+            eligible = (shared > 0) & ~connected & (ids != user_id)
+            candidates = np.flatnonzero(eligible)
+            if candidates.size > limit:
+                # Linear-time top-k; only the k survivors are sorted below
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            
+            return [
+                {
+                    'user_id': ids[i],
+                    'score': float(scores[i]),
+                    'interests': unpack_interests(int(masks[i]))
+                }
+                for i in candidates
+            ]
         except Exception as e:
             st.error(f"Error finding matches: {e}")
             return []
 
-    def _calculate_similarity(self, interests1, interests2):
-        """Calculate cosine similarity between interest vectors"""
-        # Create a set of all unique interests
-        all_interests = list(set(interests1 + interests2))
-        
-        # Create binary vectors
-        vec1 = [1 if i in interests1 else 0 for i in all_interests]
-        vec2 = [1 if i in interests2 else 0 for i in all_interests]
-        
-        # Calculate cosine similarity
-        if not vec1 or not vec2:
-            return 0
-            
-        similarity = cosine_similarity(
-            [vec1],
-            [vec2]
-        )[0][0]
-        
-        return similarity
-
-    def _check_mood_compatibility(self, mood_history1, mood_history2):
-        """Check mood compatibility between users"""
-        if not mood_history1 or not mood_history2:
-            return 0.5  # Neutral if no mood history
-            
-        # Get most recent moods
-        recent_mood1 = mood_history1[-1]['mood'] if mood_history1 else None
-        recent_mood2 = mood_history2[-1]['mood'] if mood_history2 else None
-        
-        if not recent_mood1 or not recent_mood2:
-            return 0.5
-            
-        # Simple mood matching logic
-        mood_scores = {
-            'Very Positive': 2,
-            'Positive': 1,
-            'Neutral': 0,
-            'Negative': -1,
-            'Very Negative': -2
-        }
-        
-        score1 = mood_scores.get(recent_mood1, 0)
-        score2 = mood_scores.get(recent_mood2, 0)
-        
-        # Calculate compatibility (1 for perfect match, 0 for opposite moods)
-        diff = abs(score1 - score2)
-        max_diff = 4  # Maximum possible difference
-        compatibility = 1 - (diff / max_diff)
-        
-        return compatibility
-
     def connect_buddies(self, user1_id, user2_id):
         """Connect two users as buddies"""
         if not db:
             return False
             
         try:
-            # Update both users
-            db.collection('users').document(user1_id).update({
-                'buddy_connected': user2_id
+            # Chat id is generated client-side so it can be stored on both users
+            chat_ref = db.collection('chats').document()
+            
+            # Link both users and create the chat room in one atomic commit
+            batch = db.batch()
+            batch.update(db.collection('users').document(user1_id), {
+                'buddy_connected': user2_id,
+                'chat_id': chat_ref.id
             })
-            db.collection('users').document(user2_id).update({
-                'buddy_connected': user1_id
+            batch.update(db.collection('users').document(user2_id), {
+                'buddy_connected': user1_id,
+                'chat_id': chat_ref.id
             })
-            
-            # Create a chat room
-            chat_ref = db.collection('chats').document()
-            chat_ref.set({
+            batch.set(chat_ref, {
                 'participants': [user1_id, user2_id],
-                'created_at': datetime.now(),
+                'created_at': firestore.SERVER_TIMESTAMP,
                 'last_message': None
             })
+            batch.commit()
+            load_profile.clear()
+            load_interest_matrix.clear()
+            # The profile saved with the interests predates the connection
+            st.session_state.buddy_state.pop('current_user', None)
             
             return True
         except Exception as e:
@@ -158,20 +231,23 @@ class BuddySystem:
             return False
             
         try:
-            message_ref = db.collection('chats').document(chat_id).collection('messages').document()
-            message_ref.set({
+            chat_ref = db.collection('chats').document(chat_id)
+            
+            # Write the message and the chat's last_message in one commit
+            batch = db.batch()
+            batch.set(chat_ref.collection('messages').document(), {
                 'sender_id': sender_id,
                 'content': content,
-                'timestamp': datetime.now()
+                'timestamp': firestore.SERVER_TIMESTAMP
             })
-            
-            # Update last message
-            db.collection('chats').document(chat_id).update({
+            batch.update(chat_ref, {
                 'last_message': {
                     'content': content,
-                    'timestamp': datetime.now()
+                    'timestamp': firestore.SERVER_TIMESTAMP
                 }
             })
+            batch.commit()
+            load_chat_messages.clear()
             
             return True
         except Exception as e:
@@ -183,16 +259,26 @@ class BuddySystem:
         if not db:
             return []
             
+        try:
+            return load_chat_messages(chat_id, limit)
+        except Exception as e:
+            st.error(f"Error retrieving messages: {e}")
+            return []
+
+    def get_new_messages(self, chat_id, after):
+        """Get messages posted after the given timestamp"""
+        if not db:
+            return []
+            
         try:
             messages = (
                 db.collection('chats')
                 .document(chat_id)
                 .collection('messages')
                 .order_by('timestamp')
-                .limit(limit)
+                .start_after({'timestamp': after})
                 .stream()
             )
-            
             return [msg.to_dict() for msg in messages]
         except Exception as e:
             st.error(f"Error retrieving messages: {e}")
@@ -208,8 +294,12 @@ def render_buddy_system():
         st.warning("Please log in to use the Buddy Connect feature.")
         return
     
-    # Get current user's profile
-    current_user = buddy_system.get_user_profile(st.session_state.user_id)
+    # Get current user's profile, preferring one this session just saved
+    saved = state.get('current_user')
+    if saved and time.monotonic() - saved['saved_at'] < PROFILE_TTL:
+        current_user = saved['profile']
+    else:
+        current_user = buddy_system.get_user_profile(st.session_state.user_id)
     
     if not current_user:
         st.error("Unable to load user profile.")
@@ -218,6 +308,13 @@ def render_buddy_system():
     # Check if user already has a buddy
     if current_user.get('buddy_connected'):
         buddy_id = current_user['buddy_connected']
+        # Connections made before chat_id was stored on the user need the
+        # lookup (once per session); it runs while the buddy profile loads
+        chat_future = None
+        if state['current_chat'] is None and current_user.get('chat_id'):
+            state['current_chat'] = current_user['chat_id']
+        elif state['current_chat'] is None:
+            chat_future = _LOOKUP_POOL.submit(find_chat_id, st.session_state.user_id)
         buddy = buddy_system.get_user_profile(buddy_id)
         
         if buddy:
@@ -226,17 +323,11 @@ def render_buddy_system():
             # Chat interface
             st.subheader("💬 Chat")
             
-            # Find or create chat
-            chat_query = (
-                db.collection('chats')
-                .where('participants', 'array_contains', st.session_state.user_id)
-                .limit(1)
-                .stream()
-            )
+            if chat_future is not None:
+                state['current_chat'] = chat_future.result()
             
-            chat = next(chat_query, None)
-            if chat:
-                chat_id = chat.id
+            chat_id = state['current_chat']
+            if chat_id:
                 
                 # Message input
                 message = st.text_input("Type your message...")
@@ -245,30 +336,27 @@ def render_buddy_system():
                         if buddy_system.send_message(chat_id, st.session_state.user_id, message):
                             st.rerun()
                 
+                # Load the latest page once, then only read messages newer
+                # than the last one already in the session
+                if state.get('last_ts') is None:
+                    state['chat_history'] = buddy_system.get_chat_messages(chat_id)
+                else:
+                    state['chat_history'].extend(
+                        buddy_system.get_new_messages(chat_id, state['last_ts'])
+                    )
+                if state['chat_history']:
+                    state['last_ts'] = state['chat_history'][-1]['timestamp']
+                
                 # Display messages
-                messages = buddy_system.get_chat_messages(chat_id)
-                for msg in messages:
-                    is_self = msg['sender_id'] == st.session_state.user_id
-                    
-                    with st.container():
-                        if is_self:
-                            st.markdown(f"""
-                            <div style='text-align: right;'>
-                                <small>{msg['timestamp'].strftime('%H:%M')}</small><br>
-                                <div style='background-color: #1f618d; padding: 10px; border-radius: 10px; display: inline-block;'>
-                                    {msg['content']}
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            st.markdown(f"""
-                            <div style='text-align: left;'>
-                                <small>{msg['timestamp'].strftime('%H:%M')}</small><br>
-                                <div style='background-color: #2c3e50; padding: 10px; border-radius: 10px; display: inline-block;'>
-                                    {msg['content']}
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                messages = state['chat_history']
+                user_id = st.session_state.user_id
+                st.markdown("\n".join(
+                    (SELF_MESSAGE_HTML if msg['sender_id'] == user_id else OTHER_MESSAGE_HTML).format(
+                        time=msg['timestamp'].strftime('%H:%M'),
+                        content=escape(msg['content'])
+                    )
+                    for msg in messages
+                ), unsafe_allow_html=True)
     else:
         st.info("Let's find you a buddy!")
         
@@ -277,11 +365,7 @@ def render_buddy_system():
             st.write("First, let's set up your interests:")
             interests = st.multiselect(
                 "Select your interests",
-                [
-                    "Technology", "Art", "Music", "Sports",
-                    "Reading", "Gaming", "Fitness", "Cooking",
-                    "Travel", "Movies", "Science", "Writing"
-                ],
+                BUDDY_INTERESTS,
                 max_selections=5
             )
             
@@ -289,11 +373,17 @@ def render_buddy_system():
                 db.collection('users').document(st.session_state.user_id).update({
                     'interests': interests
                 })
+                # Serve the saved profile from the session instead of re-reading it
+                state['current_user'] = {
+                    'profile': {**current_user, 'interests': interests},
+                    'saved_at': time.monotonic()
+                }
+                load_interest_matrix.clear()
                 st.success("Interests saved!")
                 st.rerun()
         else:
             # Find matches
-            matches = buddy_system.find_matches(st.session_state.user_id)
+            matches = buddy_system.find_matches(st.session_state.user_id, current_user=current_user)
             
             if matches:
                 st.write("Here are some potential buddies:")
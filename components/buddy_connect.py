@@ -1,5 +1,19 @@
 import streamlit as st
 from datetime import datetime
+from itertools import count
+from html import escape
+
+# Message ids, increasing across the process
+_message_ids = count(1)
+
+# Most recent messages returned for a conversation
+MESSAGE_WINDOW = 50
+
+# Buddy search result, filled per profile and sent to the frontend as one block
+BUDDY_CARD_HTML = (
+    "<div style='margin-bottom: 12px;'><strong>{name}</strong> - {bio}<br>"
+    "Interests: {interests}</div>"
+)
 
 class BuddyConnect:
     def __init__(self):
@@ -13,17 +27,17 @@ class BuddyConnect:
     def create_profile(self, user_id, name, interests, bio):
         """Create a new user profile in session state"""
         try:
+            now_iso = datetime.now().isoformat()
             profile = {
                 'user_id': user_id,
                 'name': name,
                 'interests': interests,
                 'bio': bio,
-                'created_at': datetime.now().isoformat(),
-                'last_active': datetime.now().isoformat()
+                'created_at': now_iso,
+                'last_active': now_iso
             }
             st.session_state.profiles[user_id] = profile
             st.session_state.connections[user_id] = []
-            st.session_state.messages[user_id] = {}
             return True
         except Exception as e:
             st.error(f"Error creating profile: {e}")
@@ -66,21 +80,18 @@ class BuddyConnect:
     def send_message(self, sender_id, receiver_id, content):
         """Send a message between users in session state"""
         try:
-            if sender_id not in st.session_state.messages:
-                st.session_state.messages[sender_id] = {}
-            if receiver_id not in st.session_state.messages[sender_id]:
-                st.session_state.messages[sender_id][receiver_id] = []
-            
-            message = {
-                'id': str(len(st.session_state.messages[sender_id][receiver_id]) + 1),
+            # One list per pair, appended in arrival order so reads never sort
+            conversation = st.session_state.messages.setdefault(
+                frozenset((sender_id, receiver_id)), []
+            )
+            conversation.append({
+                'id': str(next(_message_ids)),
                 'sender_id': sender_id,
                 'receiver_id': receiver_id,
                 'content': content,
                 'timestamp': datetime.now().isoformat(),
                 'read': False
-            }
-            
-            st.session_state.messages[sender_id][receiver_id].append(message)
+            })
             return True
         except Exception as e:
             st.error(f"Error sending message: {e}")
@@ -89,12 +100,8 @@ class BuddyConnect:
     def get_messages(self, user_id, other_user_id):
         """Get messages between two users from session state"""
         try:
-            messages = []
-            if user_id in st.session_state.messages and other_user_id in st.session_state.messages[user_id]:
-                messages.extend(st.session_state.messages[user_id][other_user_id])
-            if other_user_id in st.session_state.messages and user_id in st.session_state.messages[other_user_id]:
-                messages.extend(st.session_state.messages[other_user_id][user_id])
-            return sorted(messages, key=lambda x: x['timestamp'])
+            conversation = st.session_state.messages.get(frozenset((user_id, other_user_id)), [])
+            return conversation[-MESSAGE_WINDOW:]
         except Exception as e:
             st.error(f"Error retrieving messages: {e}")
             return []
@@ -117,15 +124,34 @@ def render_buddy_connect(storage_service, user_id):
     st.subheader("Find Buddies")
     if profile.get("interests"):
         buddies = storage_service.find_buddies_by_interest(user_id, profile["interests"])
-        for buddy in buddies:
-            st.write(f"**{buddy['name']}** - {buddy['bio']}")
-            st.write(f"Interests: {', '.join(buddy['interests'])}")
-            if st.button(f"Chat with {buddy['name']}", key=buddy['user_id']):
-                chat_id = storage_service.get_or_create_chat(user_id, buddy['user_id'])
-                render_buddy_chat(storage_service, chat_id, user_id)
+        if buddies:
+            st.markdown("".join(
+                BUDDY_CARD_HTML.format(
+                    name=escape(buddy['name']),
+                    bio=escape(buddy['bio']),
+                    interests=escape(', '.join(buddy['interests']))
+                )
+                for buddy in buddies
+            ), unsafe_allow_html=True)
+            
+            # One picker instead of a button per card; the chat stays open
+            # across reruns until another buddy is picked
+            names = {buddy['user_id']: buddy['name'] for buddy in buddies}
+            choice = st.selectbox("Chat with", list(names), format_func=names.get)
+            if st.button("Open Chat"):
+                st.session_state.open_profile = {
+                    'user_id': choice,
+                    'chat_id': storage_service.get_or_create_chat(user_id, choice)
+                }
+        else:
+            st.info("No buddies share your interests yet.")
     else:
         st.info("Add interests to find buddies.")
 
+    open_profile = st.session_state.get('open_profile')
+    if open_profile and open_profile['chat_id']:
+        render_buddy_chat(storage_service, open_profile['chat_id'], user_id)
+
 def render_buddy_chat(storage_service, chat_id, user_id):
     st.subheader("Chat")
     messages = storage_service.get_buddy_messages(chat_id)
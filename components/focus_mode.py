@@ -1,8 +1,43 @@
 import streamlit as st
-import time
+import streamlit.components.v1 as components
 from datetime import datetime, timedelta
 from services.storage_service import StorageService
 
+# Seconds between server-side checks for the end of a running session
+FOCUS_CHECK_SECONDS = 5
+
+# Digits tick once a second in the browser; the progress bar is a single
+# CSS animation, so neither needs a Python loop or a Streamlit rerun. The
+# markup depends only on the session's end and length, so reruns during a
+# session send identical HTML and the frontend keeps the running iframe
+COUNTDOWN_HTML = """
+<style>
+@keyframes focus-progress {{ from {{ width: var(--start); }} to {{ width: 100%; }} }}
+</style>
+<div id="countdown" style="text-align: center; font-size: 48px; font-weight: bold; font-family: sans-serif;"></div>
+<div style="height: 8px; background: #e0e0e0; border-radius: 4px;">
+    <div id="progress" style="height: 8px; background: #ff4b4b; border-radius: 4px;"></div>
+</div>
+<script>
+const end = {end_ms};
+const total = {duration_ms};
+const el = document.getElementById("countdown");
+const bar = document.getElementById("progress");
+const leftMs = Math.max(0, end - Date.now());
+bar.style.setProperty("--start", (total ? 100 * (1 - leftMs / total) : 100) + "%");
+bar.style.animation = "focus-progress " + (leftMs / 1000) + "s linear forwards";
+function tick() {{
+    const left = Math.max(0, Math.round((end - Date.now()) / 1000));
+    const m = String(Math.floor(left / 60)).padStart(2, "0");
+    const s = String(left % 60).padStart(2, "0");
+    el.innerText = "⏱️ " + m + ":" + s;
+    if (left === 0) clearInterval(timer);
+}}
+const timer = setInterval(tick, 1000);
+tick();
+</script>
+"""
+
 class FocusMode:
     def __init__(self):
         self.work_duration = 25 * 60  # 25 minutes in seconds
@@ -10,49 +45,33 @@ class FocusMode:
         self.long_break_duration = 15 * 60  # 15 minutes in seconds
         self.sessions_before_long_break = 4
 
-    def format_time(self, seconds):
-        """Format seconds into MM:SS"""
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"{minutes:02d}:{seconds:02d}"
-
-    def run_timer(self, duration, timer_type="work"):
-        """Run the timer with progress bar"""
-        start_time = time.time()
-        end_time = start_time + duration
-        
-        # Create a placeholder for the timer display
-        timer_placeholder = st.empty()
-        progress_placeholder = st.empty()
-        
-        while time.time() < end_time:
-            remaining = int(end_time - time.time())
-            progress = 1 - (remaining / duration)
-            
-            # Update timer display
-            timer_placeholder.markdown(f"""
-            <div style='text-align: center; font-size: 48px; font-weight: bold;'>
-                {self.format_time(remaining)}
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Update progress bar
-            progress_placeholder.progress(progress)
-            
-            # Add a small delay to prevent high CPU usage
-            time.sleep(0.1)
-        
-        # Clear the placeholders
-        timer_placeholder.empty()
-        progress_placeholder.empty()
-        
-        # Play sound when timer ends
-        st.audio("https://assets.mixkit.co/active_storage/sfx/2869/2869-preview.mp3", format="audio/mp3")
-        
-        if timer_type == "work":
-            st.success("Time's up! Take a short break.")
-        else:
-            st.success("Break's over! Time to get back to work.")
+    def render_countdown(self, end_time, duration):
+        """Countdown and progress bar to end_time, animated by the browser"""
+        components.html(COUNTDOWN_HTML.format(
+            end_ms=int(end_time.timestamp() * 1000),
+            duration_ms=int(duration * 1000)
+        ), height=100)
+
+@st.fragment(run_every=FOCUS_CHECK_SECONDS)
+def watch_focus_end(end_time):
+    """Rerun the page once the active session has run out"""
+    if datetime.now() >= end_time:
+        st.rerun()
+
+def save_focus_session(storage_service: StorageService, status: str, ended: bool = False):
+    """Record the current focus session from session state under the given status"""
+    user_id = st.session_state.get('user_id')
+    if not user_id:
+        return
+    focus_data = {
+        "task": st.session_state.focus_task,
+        "duration": st.session_state.focus_duration,
+        "start_time": st.session_state.focus_start_time.isoformat(),
+        "status": status
+    }
+    if ended:
+        focus_data["end_time"] = datetime.now().isoformat()
+    storage_service.save_focus_entry(user_id, focus_data)
 
 def render_focus_mode(storage_service: StorageService):
     """Main function to render the focus mode interface"""
@@ -76,17 +95,7 @@ def render_focus_mode(storage_service: StorageService):
                 st.session_state.focus_start_time = datetime.now()
                 st.session_state.focus_duration = duration
                 st.session_state.focus_task = task_description
-                
-                # Save focus session start
-                user_id = st.session_state.get('user_id')
-                if user_id:
-                    focus_data = {
-                        "task": task_description,
-                        "duration": duration,
-                        "start_time": datetime.now().isoformat(),
-                        "status": "active"
-                    }
-                    storage_service.save_focus_entry(user_id, focus_data)
+                save_focus_session(storage_service, "active")
                 st.rerun()
 
     # Active focus session
@@ -97,17 +106,7 @@ def render_focus_mode(storage_service: StorageService):
         if remaining_time.total_seconds() <= 0:
             st.success("Focus session completed! 🎉")
             
-            # Save completed session
-            user_id = st.session_state.get('user_id')
-            if user_id:
-                focus_data = {
-                    "task": st.session_state.focus_task,
-                    "duration": st.session_state.focus_duration,
-                    "start_time": st.session_state.focus_start_time.isoformat(),
-                    "end_time": datetime.now().isoformat(),
-                    "status": "completed"
-                }
-                storage_service.save_focus_entry(user_id, focus_data)
+            save_focus_session(storage_service, "completed", ended=True)
 
             # Reset session state
             st.session_state.focus_active = False
@@ -115,23 +114,15 @@ def render_focus_mode(storage_service: StorageService):
             if st.button("Start New Session"):
                 st.rerun()
         else:
-            # Display timer
-            mins, secs = divmod(remaining_time.seconds, 60)
-            st.header(f"⏱️ {mins:02d}:{secs:02d}")
+            # Display timer; the browser ticks it and the watcher fragment
+            # triggers the completion rerun
+            end_time = st.session_state.focus_start_time + timedelta(minutes=st.session_state.focus_duration)
+            FocusMode().render_countdown(end_time, st.session_state.focus_duration * 60)
+            watch_focus_end(end_time)
             st.write(f"Focusing on: {st.session_state.focus_task}")
 
             if st.button("End Session Early"):
-                # Save interrupted session
-                user_id = st.session_state.get('user_id')
-                if user_id:
-                    focus_data = {
-                        "task": st.session_state.focus_task,
-                        "duration": st.session_state.focus_duration,
-                        "start_time": st.session_state.focus_start_time.isoformat(),
-                        "end_time": datetime.now().isoformat(),
-                        "status": "interrupted"
-                    }
-                    storage_service.save_focus_entry(user_id, focus_data)
+                save_focus_session(storage_service, "interrupted", ended=True)
 
                 st.session_state.focus_active = False
                 st.session_state.focus_start_time = None
@@ -142,22 +133,30 @@ def render_focus_mode(storage_service: StorageService):
     user_id = st.session_state.get('user_id')
     if user_id:
         try:
-            user_data = storage_service.get_user_history(user_id)
-            focus_sessions = user_data.get('focus_history', [])
-            
-            if not focus_sessions:
+            # Totals are kept up to date on every save rather than summed here
+            stats = storage_service.get_cached_focus_stats(user_id)
+            if stats.get('sessions'):
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Total Sessions", stats['sessions'])
+                col2.metric("Total Minutes", f"{stats['minutes']:.0f}")
+                col3.metric("Avg. Session Length", f"{stats['minutes'] / stats['sessions']:.1f} min")
+
+            # Filters are answered by the storage layer's status and task-word
+            # indexes instead of scanning every session on each rerun
+            col1, col2 = st.columns(2)
+            with col1:
+                status_filter = st.selectbox("Filter by Status",
+                    ["All", "Completed", "Interrupted"])
+            with col2:
+                task_query = st.text_input("Search Tasks")
+            filtered_sessions = storage_service.get_cached_focus_history(
+                user_id, None if status_filter == "All" else status_filter, task_query)
+
+            if not filtered_sessions and status_filter == "All" and not task_query:
                 st.info("No focus sessions recorded yet. Start your first session!")
+            elif not filtered_sessions:
+                st.info("No focus sessions match these filters.")
             else:
-                # Filter options
-                status_filter = st.selectbox("Filter by Status", 
-                    ["All", "Completed", "Interrupted"])
-                
-                # Apply filters
-                filtered_sessions = focus_sessions
-                if status_filter != "All":
-                    filtered_sessions = [s for s in filtered_sessions 
-                                      if s['status'].lower() == status_filter.lower()]
-                
                 # Display sessions
                 for session in filtered_sessions:
                     with st.expander(
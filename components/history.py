@@ -3,9 +3,20 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 from datetime import datetime, timedelta
-import altair as alt
-from services.db_service import DatabaseService
 from services.storage_service import StorageService
+from services.timestamps import to_utc_series
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _mood_csv(cache_key, _df: pd.DataFrame) -> bytes:
+    """CSV export of a history view, built once per (user, data version, filters)"""
+    return _df.to_csv(index=False).encode()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _activity_matrix(cache_key, _df: pd.DataFrame) -> pd.DataFrame:
+    """Check-in counts as an hour-of-day by date matrix, built once per history view"""
+    timestamps = _df['timestamp']
+    counts = pd.crosstab(timestamps.dt.hour, timestamps.dt.date)
+    return counts.reindex(range(24), fill_value=0)
 
 class HistoryViewer:
     def __init__(self, storage_service: StorageService):
@@ -32,10 +43,11 @@ class HistoryViewer:
 
         # Get filtered data
         days = self._get_days_from_period(time_period)
-        data = self.storage_service.get_user_history(
+        moods_selected = None if "All" in mood_filter else mood_filter
+        data = self.storage_service.get_cached_history(
             user_id,
             days=days,
-            mood_filter=None if "All" in mood_filter else mood_filter
+            mood_filter=moods_selected
         )
 
         if not data or not data.get('mood_history'):
@@ -44,7 +56,17 @@ class HistoryViewer:
 
         # Convert to DataFrame
         df = pd.DataFrame(data['mood_history'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df['timestamp'] = to_utc_series(df['timestamp'])
+        # A handful of moods: group on integer codes instead of hashing strings
+        df['mood'] = df['mood'].astype('category')
+
+        # Identifies this exact view for caches derived from df
+        cache_key = (
+            user_id,
+            self.storage_service.history_synced_at(user_id),
+            days,
+            tuple(moods_selected or ()),
+        )
 
         # Create visualization tabs
         tabs = st.tabs(["Mood Trends", "Activity Heatmap", "Statistics", "Raw Data"])
@@ -53,13 +75,13 @@ class HistoryViewer:
             self._render_mood_trends(df)
 
         with tabs[1]:
-            self._render_activity_heatmap(df)
+            self._render_activity_heatmap(df, cache_key)
 
         with tabs[2]:
             self._render_statistics(df)
 
         with tabs[3]:
-            self._render_raw_data(df)
+            self._render_raw_data(df, cache_key)
 
     def _get_days_from_period(self, period: str) -> int:
         if period == "Last 7 Days":
@@ -74,7 +96,8 @@ class HistoryViewer:
         st.subheader("Mood Trends Over Time")
 
         # Line chart of mood frequencies
-        mood_counts = df.groupby([pd.Grouper(key='timestamp', freq='D'), 'mood']).size().unstack(fill_value=0)
+        day = df['timestamp'].values.astype('datetime64[D]')
+        mood_counts = df.groupby([day, 'mood'], observed=True).size().unstack(fill_value=0)
         fig = px.line(mood_counts, title="Mood Trends")
         st.plotly_chart(fig, use_container_width=True)
 
@@ -82,22 +105,18 @@ class HistoryViewer:
         fig_pie = px.pie(df, names='mood', title="Overall Mood Distribution")
         st.plotly_chart(fig_pie, use_container_width=True)
 
-    def _render_activity_heatmap(self, df: pd.DataFrame):
+    def _render_activity_heatmap(self, df: pd.DataFrame, cache_key):
         st.subheader("Activity Heatmap")
 
-        # Create daily activity counts
-        daily_counts = df.groupby(df['timestamp'].dt.date).size().reset_index()
-        daily_counts.columns = ['date', 'count']
-
-        # Create calendar heatmap using Altair
-        chart = alt.Chart(daily_counts).mark_rect().encode(
-            x='date:O',
-            y='count:Q',
-            color='count:Q'
-        ).properties(
+        # Ship a dense count grid instead of a long-form frame for Vega to bin
+        matrix = _activity_matrix(cache_key, df)
+        fig = px.imshow(
+            matrix,
+            labels=dict(x="Date", y="Hour", color="Check-ins"),
+            aspect="auto",
             title="Daily Check-in Activity"
         )
-        st.altair_chart(chart, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True)
 
     def _render_statistics(self, df: pd.DataFrame):
         st.subheader("Mood Statistics")
@@ -115,11 +134,11 @@ class HistoryViewer:
             avg_daily_checkins = len(df) / (df['timestamp'].max() - df['timestamp'].min()).days
             st.metric("Avg. Daily Check-ins", f"{avg_daily_checkins:.1f}")
 
-    def _render_raw_data(self, df: pd.DataFrame):
+    def _render_raw_data(self, df: pd.DataFrame, cache_key):
         st.subheader("Raw Data")
 
-        # Add download button
-        csv = df.to_csv(index=False)
+        # Add download button; paging reruns reuse the cached export
+        csv = _mood_csv(cache_key, df)
         st.download_button(
             "Download CSV",
             csv,
@@ -130,7 +149,8 @@ class HistoryViewer:
 
         # Display paginated data
         page_size = 10
-        page_number = st.number_input("Page", min_value=1, value=1)
+        page_count = max(1, (len(df) + page_size - 1) // page_size)
+        page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1)
         start_idx = (page_number - 1) * page_size
         end_idx = start_idx + page_size
 
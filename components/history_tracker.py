@@ -3,75 +3,69 @@ from datetime import datetime, timedelta
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-from config import db, is_firestore_available
+import numpy as np
+from firebase_admin import firestore
+from collections import deque
+from config import MAX_LOCAL_HISTORY
 from services.storage_service import StorageService
+from services.timestamps import now_ns, to_utc_series
 
-def get_user_history(db, user_id):
+def get_user_history(storage_service: StorageService, user_id):
     """Fetch user history from Firestore"""
-    if not is_firestore_available():
+    if not storage_service.is_firestore_available():
         st.warning("Database not available. Using local storage.")
         return {
-            'mood_history': st.session_state.get('local_mood_history', []),
-            'focus_history': st.session_state.get('local_focus_history', []),
-            'task_history': st.session_state.get('local_task_history', [])
+            'mood_history': list(st.session_state.get('local_mood_history', [])),
+            'focus_history': list(st.session_state.get('local_focus_history', [])),
+            'task_history': list(st.session_state.get('local_task_history', []))
         }
     
     try:
-        doc_ref = db.collection('users').document(user_id)
+        doc_ref = storage_service.db.collection('users').document(user_id)
         doc = doc_ref.get()
         if doc.exists:
             return doc.to_dict()
     except Exception as e:
         st.warning(f"Error fetching history: {str(e)}. Using local storage.")
         return {
-            'mood_history': st.session_state.get('local_mood_history', []),
-            'focus_history': st.session_state.get('local_focus_history', []),
-            'task_history': st.session_state.get('local_task_history', [])
+            'mood_history': list(st.session_state.get('local_mood_history', [])),
+            'focus_history': list(st.session_state.get('local_focus_history', [])),
+            'task_history': list(st.session_state.get('local_task_history', []))
         }
     return None
 
-def update_user_history(db, user_id, activity_type, data):
+def local_history(activity_type):
+    """Session fallback list for an activity type, capped at MAX_LOCAL_HISTORY entries"""
+    return st.session_state.setdefault(
+        f'local_{activity_type}_history', deque(maxlen=MAX_LOCAL_HISTORY)
+    )
+
+def update_user_history(storage_service: StorageService, user_id, activity_type, data):
     """Update user history in Firestore"""
-    if not is_firestore_available():
+    if not storage_service.is_firestore_available():
         # Fallback to session state
-        if f'local_{activity_type}_history' not in st.session_state:
-            st.session_state[f'local_{activity_type}_history'] = []
-        st.session_state[f'local_{activity_type}_history'].append(data)
+        local_history(activity_type).append(data)
+        st.session_state.setdefault(f'pending_{activity_type}_history', []).append(data)
         return
 
     try:
-        doc_ref = db.collection('users').document(user_id)
+        doc_ref = storage_service.db.collection('users').document(user_id)
         
         # Add timestamp to the data
-        data['timestamp'] = datetime.now().isoformat()
+        data['timestamp'] = now_ns()
         data['activity_type'] = activity_type
         
-        # Get current history
-        doc = doc_ref.get()
-        if doc.exists:
-            current_data = doc.to_dict()
-            history_array = current_data.get(f'{activity_type}_history', [])
-            history_array.append(data)
-            
-            # Update Firestore
-            doc_ref.update({
-                f'{activity_type}_history': history_array
-            })
-            
-            # Update session state as backup
-            st.session_state[f'local_{activity_type}_history'] = history_array
-        else:
-            # Create new document with initial history
-            doc_ref.set({
-                f'{activity_type}_history': [data]
-            })
-            st.session_state[f'local_{activity_type}_history'] = [data]
-            
+        # Append just this entry; merge creates the document if it is missing
+        doc_ref.set({
+            f'{activity_type}_history': firestore.ArrayUnion([data])
+        }, merge=True)
+        
+        # Update session state as backup
+        local_history(activity_type).append(data)
     except Exception as e:
         st.warning(f"Failed to update database: {str(e)}. Using local storage.")
-        if f'local_{activity_type}_history' not in st.session_state:
-            st.session_state[f'local_{activity_type}_history'] = []
-        st.session_state[f'local_{activity_type}_history'].append(data)
+        local_history(activity_type).append(data)
+        st.session_state.setdefault(f'pending_{activity_type}_history', []).append(data)
 
 def render_history_dashboard(storage_service: StorageService, user_id: str):
     """Render the history dashboard with latest data"""
@@ -81,7 +75,7 @@ def render_history_dashboard(storage_service: StorageService, user_id: str):
     storage_service.sync_user_data(user_id)
     
     # Get complete user history
-    user_data = storage_service.get_user_history(user_id)
+    user_data = storage_service.get_cached_history(user_id)
     
     # Display filters
     col1, col2 = st.columns(2)
@@ -107,7 +101,7 @@ def render_history_dashboard(storage_service: StorageService, user_id: str):
     days_filter = days_map[time_filter]
     
     # Get filtered data
-    filtered_data = storage_service._filter_history(user_data, days_filter, None)
+    filtered_data = storage_service._filter_history(user_data, days_filter, None, user_id)
     
     # Display activity summaries
     if "Mood" in activity_type and filtered_data.get('mood_history'):
@@ -128,10 +122,17 @@ def render_mood_history(mood_history, start_date=None):
         return
 
     df = pd.DataFrame(mood_history)
-    # Convert timestamps to pandas datetime (with UTC awareness)
-    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
-
-    st.dataframe(df)
+    # Epoch-ns values need a cast to display as dates; to_utc_series does that
+    # in one vectorized step and only parses strings left by older entries
+    df['timestamp'] = to_utc_series(df['timestamp'])
+
+    st.dataframe(
+        df,
+        column_config={
+            'timestamp': st.column_config.DatetimeColumn("Time", format="D MMM YYYY, h:mm a")
+        },
+        hide_index=True
+    )
 
 def render_focus_history(focus_history, start_date):
     st.subheader("🎯 Focus Sessions")
@@ -142,8 +143,8 @@ def render_focus_history(focus_history, start_date):
 
     # Convert to DataFrame
     df = pd.DataFrame(focus_history)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df[df['timestamp'] >= start_date]
+    df['timestamp'] = to_utc_series(df['timestamp'])
+    df = df[df['timestamp'] >= pd.Timestamp(start_date, tz='UTC')]
 
     # Focus session statistics
     total_sessions = len(df)
@@ -164,8 +165,8 @@ def render_task_history(task_history, start_date):
 
     # Convert to DataFrame
     df = pd.DataFrame(task_history)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df[df['timestamp'] >= start_date]
+    df['timestamp'] = to_utc_series(df['timestamp'])
+    df = df[df['timestamp'] >= pd.Timestamp(start_date, tz='UTC')]
 
     # Task completion statistics
     total_tasks = len(df)
@@ -178,28 +179,19 @@ def render_task_history(task_history, start_date):
     col3.metric("Completion Rate", f"{completion_rate:.1f}%")
 
 def calculate_streak(user_data):
-    # Combine all activities
-    all_activities = []
-    for activity_type in ['mood_history', 'focus_history', 'task_history']:
-        activities = user_data.get(activity_type, [])
-        all_activities.extend([(datetime.fromisoformat(a['timestamp']).date(), 1) for a in activities])
-
-    if not all_activities:
+    """Count consecutive active days ending at the most recent activity"""
+    timestamps = [
+        a['timestamp']
+        for activity_type in ('mood_history', 'focus_history', 'task_history')
+        for a in user_data.get(activity_type, [])
+    ]
+    if not timestamps:
         return 0
 
-    # Sort activities by date
-    all_activities.sort(reverse=True)
-    dates = [date for date, _ in all_activities]
-    
-    # Calculate streak
-    streak = 1
-    current_date = dates[0]
-    
-    for date in dates[1:]:
-        if date == current_date - timedelta(days=1):
-            streak += 1
-            current_date = date
-        else:
-            break
-    
-    return streak 
\ No newline at end of file
+    # Parse in one vectorized pass and reduce to distinct days, newest first
+    parsed = to_utc_series(timestamps).dropna()
+    days = np.unique(parsed.values.astype('datetime64[D]'))[::-1]
+
+    # The streak ends at the first gap that isn't exactly one day
+    breaks = np.flatnonzero(np.diff(days.astype('i8')) != -1)
+    return int(breaks[0]) + 1 if breaks.size else len(days)
@@ -1,78 +1,128 @@
 import streamlit as st
-from groq import Groq
-from datetime import datetime
-from services.db_service import DatabaseService
+from pathlib import Path
+from html import escape
 from services.storage_service import StorageService
-import time
+from services.timestamps import now_ns
+from services.llm import stream_text, get_groq_client, groq_api_key
+
+# Identical on every call so the provider can reuse the cached prompt prefix;
+# the per-turn mood and style go in a context message just before the user turn
+MOOD_SYSTEM_PROMPT = """You are a supportive AI companion helping users track and understand their mood.
+
+Guidelines:
+1. Never provide medical advice
+2. Encourage professional help when needed
+3. Be empathetic and understanding
+4. Keep responses concise
+5. Use appropriate emojis
+6. Ask thoughtful follow-up questions"""
+
+MOOD_CONTEXT_PROMPT = """Current mood: {mood}
+Style: {style}"""
+
+# History sent to the model starts at a fixed anchor instead of sliding with
+# every turn; once more than CHAT_WINDOW_MAX messages follow it, the anchor
+# jumps forward leaving CHAT_WINDOW_KEEP, so the prefix changes rarely
+CHAT_WINDOW_MAX = 10
+CHAT_WINDOW_KEEP = 2
+
+# In-session chat history is trimmed by CHAT_HISTORY_TRIM of its oldest turns
+# once it passes CHAT_HISTORY_MAX; trimmed turns are already queued for Firestore
+CHAT_HISTORY_MAX = 100
+CHAT_HISTORY_TRIM = 50
+
+CHAT_CSS_PATH = Path(__file__).resolve().parent.parent / "static" / "css" / "style.css"
+
+@st.cache_data(show_spinner=False)
+def chat_css() -> str:
+    """Chat stylesheet contents, read from disk once per process"""
+    try:
+        return CHAT_CSS_PATH.read_text()
+    except OSError:
+        return ""
+
+CONVERSATION_STYLES = {
+    "Supportive": "You are a supportive and empathetic listener.",
+    "Motivational": "You are an encouraging and uplifting coach.",
+    "Analytical": "You are a thoughtful and logical guide."
+}
+
+# Replies remembered per session for repeated messages ("ok", "thanks", ...)
+CHAT_CACHE_SIZE = 100
+
+def normalize_message(message: str) -> str:
+    """Case, whitespace and trailing-punctuation insensitive form used as a cache key"""
+    return " ".join(message.lower().split()).strip(" .!?")
+
+CHAT_MESSAGE_HTML = '<div class="chat-message {css_class}">{content}</div>'
 
 class MoodBot:
     def __init__(self, storage_service: StorageService):
         self.storage_service = storage_service
-        self.api_key = st.secrets["GROQ_API_KEY"]
-        self.client = Groq(api_key=self.api_key)
+        self.api_key = groq_api_key()
+        self.client = get_groq_client(self.api_key)
         self.model = "llama3-70b-8192"
         
-        # Initialize styles
-        self.conversation_styles = {
-            "Supportive": "You are a supportive and empathetic listener.",
-            "Motivational": "You are an encouraging and uplifting coach.",
-            "Analytical": "You are a thoughtful and logical guide."
-        }
+        self.conversation_styles = CONVERSATION_STYLES
 
-    def get_chat_response(self, user_message: str, mood: str, style: str) -> str:
-        """Get AI response with loading indicator"""
-        with st.spinner('AI is thinking...'):
-            try:
-                system_message = self._create_system_message(mood, style)
-                messages = self._prepare_messages(system_message, user_message)
-                
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=150
-                )
-                
-                return response.choices[0].message.content
-            except Exception as e:
-                st.error(f"Error getting AI response: {str(e)}")
-                return None
-
-    def _create_system_message(self, mood: str, style: str) -> str:
-        return f"""You are a supportive AI companion helping users track and understand their mood.
-        Current mood: {mood}
-        Style: {self.conversation_styles[style]}
-        
-        Guidelines:
-        1. Never provide medical advice
-        2. Encourage professional help when needed
-        3. Be empathetic and understanding
-        4. Keep responses concise
-        5. Use appropriate emojis
-        6. Ask thoughtful follow-up questions
-        """
-
-    def _prepare_messages(self, system_message: str, user_message: str) -> list:
-        messages = [{"role": "system", "content": system_message}]
-        
-        # Add chat history context
-        if 'chat_history' in st.session_state:
-            for msg in st.session_state.chat_history[-5:]:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
+    def get_chat_response(self, user_message: str, mood: str, style: str, container=None) -> str:
+        """Stream the AI response into container as it arrives and return the full text"""
+        # Per session only: replies can draw on this user's own history
+        cache = st.session_state.setdefault('chat_response_cache', {})
+        key = (normalize_message(user_message), mood, style)
+        if key in cache:
+            with container if container is not None else st.container():
+                st.write(cache[key])
+            return cache[key]
+        try:
+            context_message = self._create_context_message(mood, style)
+            messages = self._prepare_messages(context_message, user_message)
+
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=150,
+                stream=True
+            )
+
+            with container if container is not None else st.container():
+                reply = st.write_stream(stream_text(response)) or None
+            if reply:
+                if len(cache) >= CHAT_CACHE_SIZE:
+                    cache.pop(next(iter(cache)))
+                cache[key] = reply
+            return reply
+        except Exception as e:
+            st.error(f"Error getting AI response: {str(e)}")
+            return None
+
+    def _create_context_message(self, mood: str, style: str) -> str:
+        return MOOD_CONTEXT_PROMPT.format(mood=mood, style=self.conversation_styles[style])
+
+    def _prepare_messages(self, context_message: str, user_message: str) -> list:
+        """Static prompt, then history, then per-turn context, so the prefix stays cacheable"""
+        messages = [{"role": "system", "content": MOOD_SYSTEM_PROMPT}]
+
+        # Add chat history context from the anchored window
+        history = st.session_state.get('chat_history', [])
+        anchor = st.session_state.get('chat_prefix_anchor')
+        if anchor is None or anchor > len(history) or len(history) - anchor > CHAT_WINDOW_MAX:
+            anchor = max(0, len(history) - CHAT_WINDOW_KEEP)
+            st.session_state.chat_prefix_anchor = anchor
+        for msg in history[anchor:]:
+            messages.append({
+                "role": msg["role"],
+                "content": msg["content"]
+            })
+
+        messages.append({"role": "system", "content": context_message})
         messages.append({"role": "user", "content": user_message})
         return messages
 
     def render_chat_interface(self):
-        st.markdown("""
-            <style>
-                /* Import custom CSS */
-                @import url('static/css/style.css');
-            </style>
-        """, unsafe_allow_html=True)
+        # Inline the stylesheet: the markup is identical every rerun, so nothing is refetched
+        st.markdown(f"<style>{chat_css()}</style>", unsafe_allow_html=True)
 
         # Mood selection
         moods = ["😊 Happy", "😢 Sad", "😡 Angry", "😰 Anxious", "😴 Tired", "😌 Calm"]
@@ -86,18 +136,18 @@ class MoodBot:
         chat_container = st.container()
         
         with chat_container:
-            st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-            
-            # Display chat history
-            for msg in st.session_state.get('chat_history', []):
-                css_class = "user-message" if msg["role"] == "user" else "ai-message"
-                st.markdown(f"""
-                    <div class="chat-message {css_class}">
-                        {msg["content"]}
-                    </div>
-                """, unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
+            # Display chat history as one element instead of one per message
+            st.markdown("".join([
+                '<div class="chat-container">',
+                *(
+                    CHAT_MESSAGE_HTML.format(
+                        css_class="user-message" if msg["role"] == "user" else "ai-message",
+                        content=escape(msg["content"])
+                    )
+                    for msg in st.session_state.get('chat_history', [])
+                ),
+                '</div>'
+            ]), unsafe_allow_html=True)
 
         # Input form
         with st.form(key="chat_form", clear_on_submit=True):
@@ -105,8 +155,8 @@ class MoodBot:
             submit_button = st.form_submit_button("Send")
             
             if submit_button and user_message:
-                # Get AI response
-                ai_response = self.get_chat_response(user_message, mood, style)
+                # Stream the AI response under the chat history
+                ai_response = self.get_chat_response(user_message, mood, style, chat_container)
                 
                 if ai_response:
                     # Save to database
@@ -122,21 +172,30 @@ class MoodBot:
             "ai_response": ai_response,
             "mood": mood,
             "style": style,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_ns()
         }
         
         user_id = st.session_state.get('user_id')
         if user_id:
             self.storage_service.save_mood_entry(user_id, chat_data)
         
-        # Update local chat history
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
-        
-        st.session_state.chat_history.extend([
-            {"role": "user", "content": user_message},
-            {"role": "assistant", "content": ai_response}
-        ])
+        # Update local chat history; timestamps keep repeated messages distinct
+        # when the new turns are appended to Firestore with ArrayUnion
+        turns = [
+            {"role": "user", "content": user_message, "timestamp": chat_data["timestamp"]},
+            {"role": "assistant", "content": ai_response, "timestamp": chat_data["timestamp"]}
+        ]
+        history = st.session_state.setdefault('chat_history', [])
+        history.extend(turns)
+        st.session_state.setdefault('pending_chat_history', []).extend(turns)
+
+        # Trim in bulk rather than per turn so the anchored prompt window only
+        # shifts once per trim; keep the anchor on the same message
+        if len(history) > CHAT_HISTORY_MAX:
+            del history[:CHAT_HISTORY_TRIM]
+            anchor = st.session_state.get('chat_prefix_anchor')
+            if anchor is not None:
+                st.session_state.chat_prefix_anchor = max(0, anchor - CHAT_HISTORY_TRIM)
 
 def render_mood_check_in(storage_service: StorageService):
     """Main function to render the mood check-in interface"""
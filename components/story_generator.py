@@ -1,17 +1,48 @@
 import streamlit as st
-from groq import Groq
-import os
 from datetime import datetime
-import json
+from services.llm import stream_text, ResponseCache, get_groq_client, groq_api_key
+
+# Static prompt text comes first and is byte-identical across calls so
+# providers can reuse the cached prefix; only the story options vary, at the end
+STORY_SYSTEM_PROMPT = """You are a creative storyteller who creates inspiring and motivational stories for students.
+- Create engaging narratives that resonate with young readers
+- Include vivid descriptions and emotional depth
+- Ensure the story has a clear moral or lesson
+- Keep the language accessible and relatable
+- Make the story uplifting and hopeful
+- Include specific details that bring the story to life
+- End with a meaningful conclusion that ties everything together
+- Add motivational quotes or lessons
+- Include relatable characters and situations
+- Focus on personal growth and learning
+- Provide actionable insights
+- Use positive and encouraging language"""
+
+STORY_PROMPT = """Create an inspirational story for students that:
+1. Is uplifting and motivational
+2. Has a clear moral or lesson
+3. Includes relatable characters
+4. Provides actionable insights
+5. Ends with a motivational message
+6. Matches the mood, theme and length given below
+
+Make the story engaging and relatable to students. Include specific examples and situations they might encounter.
+
+Mood: {mood}
+Theme: {theme}
+Length: {length}
+Motivational quotes: {quotes}"""
+
+# Session story collection, stored column-wise like UserHistory
+STORY_COLUMNS = ('theme', 'mood', 'story', 'timestamp')
+
+# Finished stories by (mood, theme, length, quotes); repeat requests skip the API call
+_story_cache = ResponseCache(max_entries=256, ttl=3600)
 
 class StoryGenerator:
     def __init__(self):
-        # Try to get API key from environment variable first
-        api_key = os.getenv("GROQ_API_KEY")
-        
-        # If not in environment, try secrets
-        if not api_key and "GROQ_API_KEY" in st.secrets:
-            api_key = st.secrets["GROQ_API_KEY"]
+        # Environment variable first, then secrets
+        api_key = groq_api_key()
             
         if not api_key:
             st.error("""
@@ -31,53 +62,44 @@ class StoryGenerator:
             return
             
         try:
-            self.client = Groq(api_key=api_key)
+            self.client = get_groq_client(api_key)
             self.model = "llama3-70b-8192"  # Using the latest recommended model
         except Exception as e:
             st.error(f"Error initializing Groq client: {e}")
             return
 
-    def generate_story(self, mood, theme):
+    def generate_story(self, mood, theme, length="Medium (3-4 paragraphs)", include_quotes=True, fresh=False):
+        """Show a story for these options, reusing a cached one unless fresh is set"""
+        key = (mood.strip().lower(), theme, length, include_quotes)
+        story = None if fresh else _story_cache.get(key)
+        if story:
+            st.write(story)
+            return story
         try:
-            system_message = """You are a creative storyteller who creates inspiring and motivational stories for students.
-            - Create engaging narratives that resonate with young readers
-            - Include vivid descriptions and emotional depth
-            - Ensure the story has a clear moral or lesson
-            - Keep the language accessible and relatable
-            - Make the story uplifting and hopeful
-            - Include specific details that bring the story to life
-            - End with a meaningful conclusion that ties everything together
-            - Add motivational quotes or lessons
-            - Include relatable characters and situations
-            - Focus on personal growth and learning
-            - Provide actionable insights
-            - Use positive and encouraging language"""
-            
-            prompt = f"""Create an inspirational story for students that:
-            1. Matches the mood: {mood}
-            2. Focuses on the theme: {theme}
-            3. Is uplifting and motivational
-            4. Is 3-4 paragraphs long
-            5. Has a clear moral or lesson
-            6. Includes relatable characters
-            7. Provides actionable insights
-            8. Ends with a motivational message
-            
-            Make the story engaging and relatable to students. Include specific examples and situations they might encounter."""
+            prompt = STORY_PROMPT.format(
+                mood=key[0],
+                theme=theme,
+                length=length,
+                quotes="include a few" if include_quotes else "none"
+            )
 
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system_message},
+                    {"role": "system", "content": STORY_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.8,
                 max_tokens=800,
                 presence_penalty=0.6,
-                frequency_penalty=0.6
+                frequency_penalty=0.6,
+                stream=True
             )
 
-            return response.choices[0].message.content
+            story = st.write_stream(stream_text(response)) or None
+            if story:
+                _story_cache.put(key, story)
+            return story
         except Exception as e:
             st.error(f"Error generating story: {e}")
             return None
@@ -125,33 +147,35 @@ def render_story_generator():
     with col2:
         include_quotes = st.checkbox("Include motivational quotes", value=True)
     
-    if st.button("Generate Story"):
+    col1, col2 = st.columns(2)
+    with col1:
+        generate = st.button("Generate Story")
+    with col2:
+        # Same options, but skip the cached story and ask for a new one
+        regenerate = st.button("Generate Another Story")
+
+    if generate or regenerate:
         if mood:
-            with st.spinner("Creating your inspirational story..."):
-                story = story_generator.generate_story(mood, selected_theme)
-                if story:
-                    st.write("---")
-                    st.write(story)
-                    
-                    # Save to session state
-                    if 'stories' not in st.session_state:
-                        st.session_state.stories = []
-                    st.session_state.stories.append({
-                        'theme': selected_theme,
-                        'mood': mood,
-                        'story': story,
-                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                    
-                    if st.button("Generate Another Story"):
-                        st.rerun()
+            # The story streams in below the divider, so no spinner is needed
+            st.write("---")
+            story = story_generator.generate_story(
+                mood, selected_theme, story_length, include_quotes, fresh=regenerate
+            )
+            if story:
+                # Save to session state
+                stories = st.session_state.setdefault('stories', {name: [] for name in STORY_COLUMNS})
+                row = (selected_theme, mood, story, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                for name, value in zip(STORY_COLUMNS, row):
+                    stories[name].append(value)
         else:
             st.warning("Please enter your mood to generate a story.")
             
     # Display saved stories
-    if 'stories' in st.session_state and st.session_state.stories:
+    stories = st.session_state.get('stories')
+    if stories and stories['story']:
         st.write("---")
         st.subheader("📚 Your Story Collection")
-        for story in reversed(st.session_state.stories):
-            with st.expander(f"{story['theme']} - {story['mood']} ({story['timestamp']})"):
-                st.write(story['story']) 
\ No newline at end of file
+        rows = zip(*(reversed(stories[name]) for name in STORY_COLUMNS))
+        for theme, story_mood, story, timestamp in rows:
+            with st.expander(f"{theme} - {story_mood} ({timestamp})"):
+                st.write(story) 
\ No newline at end of file
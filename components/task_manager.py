@@ -1,24 +1,111 @@
 import streamlit as st
-from datetime import datetime, timedelta, time
-import json
-from groq import Groq
-import os
+from datetime import date, datetime, timedelta, time
+import orjson
+import hashlib
+import asyncio
+import logging
+from concurrent.futures import TimeoutError as FuturesTimeout
+import time as clock
+from groq import AsyncGroq
 from services.storage_service import StorageService
+from config import TASK_PAGE_SIZE
+from services.timestamps import now_ns
+from services.llm import get_groq_client, groq_api_key, stream_text, ResponseCache
 
-class TimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, time):
-            return obj.strftime("%H:%M")
-        return super().default(obj)
+logger = logging.getLogger(__name__)
+
+# Static prompt text comes first and is byte-identical across calls so
+# providers can reuse the cached prefix; tasks and preferences go at the end
+SCHEDULE_SYSTEM_PROMPT = """You are an AI task scheduler that helps users organize their tasks efficiently.
+- Create a realistic and balanced schedule
+- Consider task priorities and deadlines
+- Include breaks and buffer time
+- Suggest optimal time slots for each task
+- Provide clear time allocations
+- Ensure the schedule is flexible and manageable
+- Include motivational messages and tips"""
+
+SCHEDULE_PROMPT = """Create a daily schedule based on the tasks and preferences below.
+
+Please provide:
+1. A time-based schedule for the day
+2. Suggested time slots for each task
+3. Break times
+4. Any additional tips or recommendations
+
+Tasks:
+{tasks}
+
+Preferences:
+{preferences}"""
+
+# Sampling settings shared by interactive and batched schedule requests
+SCHEDULE_PARAMS = {
+    "temperature": 0.7,
+    "max_tokens": 500,
+    "presence_penalty": 0.6,
+    "frequency_penalty": 0.6,
+}
+
+# Seconds a batch may run before unfinished schedules fall back to direct calls
+SCHEDULE_BATCH_TIMEOUT = 120
+SCHEDULE_BATCH_DONE = ("completed", "failed", "expired", "cancelled")
+# Concurrent direct completions allowed at once, to stay inside Groq rate limits
+SCHEDULE_CONCURRENCY = 4
+
+# Task fields the scheduler uses; ids, status and timestamps only cost prompt tokens
+SCHEDULE_TASK_FIELDS = ("title", "description", "priority", "due_date")
+
+# Preset working hours for the schedule preferences
+DEFAULT_WORK_START = time(9, 0)
+DEFAULT_WORK_END = time(17, 0)
+
+# Seconds without a status toggle before the queued toggles are written together
+TASK_FLUSH_SECONDS = 2
+
+# Tasks sent to the scheduler; a day holds only so many, and long lists
+# would cost prompt tokens and latency for tasks that could not be placed
+SCHEDULE_MAX_TASKS = 20
+
+# Orders tasks in the prompt so the same task set always serializes identically
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+
+# Completed schedules shared across sessions; the same tasks and preferences reuse one for a day
+_schedule_cache = ResponseCache(max_entries=512, ttl=24 * 60 * 60)
+
+def _prompt_default(value):
+    """orjson fallback: times as "HH:MM", dates and datetimes as ISO strings"""
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError
+
+def prompt_json(value) -> str:
+    """Compact, key-sorted JSON for prompts"""
+    return orjson.dumps(
+        value,
+        default=_prompt_default,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    ).decode()
+
+def canonical_tasks(tasks):
+    """The SCHEDULE_MAX_TASKS most urgent distinct tasks, projected to the scheduling fields"""
+    projected = (
+        {field: task[field] for field in SCHEDULE_TASK_FIELDS if task.get(field)}
+        for task in tasks
+    )
+    unique = {prompt_json(task): task for task in projected}
+    return sorted(unique.values(), key=lambda t: (
+        PRIORITY_RANK.get(t.get('priority'), len(PRIORITY_RANK)),
+        str(t.get('due_date', '')),
+        str(t.get('title', ''))
+    ))[:SCHEDULE_MAX_TASKS]
 
 class TaskManager:
     def __init__(self):
-        # Try to get API key from environment variable first
-        api_key = os.getenv("GROQ_API_KEY")
-        
-        # If not in environment, try secrets
-        if not api_key and "GROQ_API_KEY" in st.secrets:
-            api_key = st.secrets["GROQ_API_KEY"]
+        # Environment variable first, then secrets
+        api_key = groq_api_key()
             
         if not api_key:
             st.error("""
@@ -38,73 +125,214 @@ class TaskManager:
             return
             
         try:
-            self.client = Groq(api_key=api_key)
+            self.client = get_groq_client(api_key)
+            self.api_key = api_key
             self.model = "llama3-70b-8192"  # Using the latest recommended model
         except Exception as e:
             st.error(f"Error initializing Groq client: {e}")
             return
 
-    def generate_schedule(self, tasks, preferences):
+    def _schedule_messages(self, tasks, preferences):
+        prompt = SCHEDULE_PROMPT.format(
+            tasks=prompt_json(canonical_tasks(tasks)),
+            preferences=prompt_json(preferences)
+        )
+        return [
+            {"role": "system", "content": SCHEDULE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _schedule_key(messages) -> str:
+        """Cache key for a schedule request, derived from its exact prompt"""
+        return hashlib.sha256(messages[-1]["content"].encode()).hexdigest()
+
+    def generate_schedule(self, tasks, preferences, container=None):
+        """Generate a schedule, reusing one for the same prompt; streams into container if given"""
         try:
-            system_message = """You are an AI task scheduler that helps users organize their tasks efficiently.
-            - Create a realistic and balanced schedule
-            - Consider task priorities and deadlines
-            - Include breaks and buffer time
-            - Suggest optimal time slots for each task
-            - Provide clear time allocations
-            - Ensure the schedule is flexible and manageable
-            - Include motivational messages and tips"""
-            
-            prompt = f"""Create a daily schedule based on these tasks and preferences:
-            
-            Tasks:
-            {json.dumps(tasks, indent=2, cls=TimeEncoder)}
-            
-            Preferences:
-            {json.dumps(preferences, indent=2, cls=TimeEncoder)}
-            
-            Please provide:
-            1. A time-based schedule for the day
-            2. Suggested time slots for each task
-            3. Break times
-            4. Any additional tips or recommendations"""
+            messages = self._schedule_messages(tasks, preferences)
+            cache = st.session_state.setdefault('schedule_cache', {})
+            key = self._schedule_key(messages)
+            if key not in cache and (schedule := _schedule_cache.get(key)) is not None:
+                cache[key] = schedule
+            if key in cache:
+                if container is not None:
+                    container.markdown(cache[key])
+                return cache[key]
 
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500,
-                presence_penalty=0.6,
-                frequency_penalty=0.6
+                messages=messages,
+                stream=container is not None,
+                **SCHEDULE_PARAMS
             )
-
-            return response.choices[0].message.content
+            if container is not None:
+                with container:
+                    schedule = st.write_stream(stream_text(response)) or None
+            else:
+                schedule = response.choices[0].message.content
+            if schedule:
+                cache[key] = schedule
+                _schedule_cache.put(key, schedule)
+            return schedule
         except Exception as e:
             st.error(f"Error generating schedule: {e}")
             return None
 
+    def _cached_schedules(self, pairs, fill):
+        """Schedules for (tasks, preferences) pairs from the shared cache; fill(pending) supplies the rest"""
+        requests = {}
+        for tasks, preferences in pairs:
+            messages = self._schedule_messages(tasks, preferences)
+            requests[self._schedule_key(messages)] = messages
+        schedules = {key: _schedule_cache.get(key) for key in requests}
+        pending = {key: requests[key] for key, schedule in schedules.items() if schedule is None}
+        if pending:
+            for key, schedule in fill(pending).items():
+                if schedule is not None:
+                    schedules[key] = schedule
+                    _schedule_cache.put(key, schedule)
+        return [schedules[key] for key in requests]
+
+    def generate_schedule_batch(self, tasks_list, preferences_list, timeout=SCHEDULE_BATCH_TIMEOUT):
+        """Generate schedules via the Batch API into the shared cache; safe to run from a background job"""
+        return self._cached_schedules(
+            zip(tasks_list, preferences_list),
+            lambda pending: self._batch_then_direct(pending, timeout)
+        )
+
+    def _batch_then_direct(self, pending, timeout):
+        results = {}
+        try:
+            results.update(self._run_schedule_batch(pending, timeout))
+        except Exception:
+            # The batch endpoint is an optimization; direct calls below still cover every request
+            logger.exception("Schedule batch failed, falling back to direct requests")
+        missing = {key: pending[key] for key in pending if results.get(key) is None}
+        if missing:
+            results.update(self._complete_schedules(missing))
+        return results
+
+    def _complete_schedules(self, requests):
+        """Run requests concurrently; failures are logged and left out of the results"""
+        results = asyncio.run(self._complete_schedules_async(list(requests.values())))
+        completed = {}
+        for key, result in zip(requests, results):
+            if isinstance(result, Exception):
+                logger.warning("Schedule request failed: %s", result)
+            else:
+                completed[key] = result
+        return completed
+
+    async def _complete_schedules_async(self, requests):
+        semaphore = asyncio.Semaphore(SCHEDULE_CONCURRENCY)
+        # A fresh async client per run: its connections belong to this event loop
+        async with AsyncGroq(api_key=self.api_key) as client:
+            async def complete(messages):
+                async with semaphore:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        **SCHEDULE_PARAMS
+                    )
+                    return response.choices[0].message.content
+            return await asyncio.gather(*(complete(m) for m in requests), return_exceptions=True)
+
+    def _run_schedule_batch(self, pending, timeout):
+        """Submit pending requests as one batch and collect whatever finishes before timeout"""
+        lines = [
+            orjson.dumps({
+                "custom_id": key,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": self.model, "messages": messages, **SCHEDULE_PARAMS},
+            })
+            for key, messages in pending.items()
+        ]
+        batch_file = self.client.files.create(
+            file=("schedules.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+
+        deadline = clock.monotonic() + timeout
+        delay = 1.0
+        while batch.status not in SCHEDULE_BATCH_DONE and clock.monotonic() < deadline:
+            clock.sleep(min(delay, max(0.0, deadline - clock.monotonic())))
+            delay *= 2
+            batch = self.client.batches.retrieve(batch.id)
+
+        if batch.status not in SCHEDULE_BATCH_DONE:
+            self.client.batches.cancel(batch.id)
+            # Requests finished before the cancel are in the refreshed output file
+            batch = self.client.batches.retrieve(batch.id)
+        if not batch.output_file_id:
+            return {}
+
+        results = {}
+        output = self.client.files.content(batch.output_file_id).read().decode()
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        return results
+
     def save_task(self, task):
-        if 'tasks' not in st.session_state:
-            st.session_state.tasks = []
-            
-        task['id'] = len(st.session_state.tasks) + 1
+        tasks = st.session_state.setdefault('tasks', {})
+
+        # Ids are never reused, unlike len(tasks) + 1 after a delete
+        task['id'] = st.session_state.get('next_task_id', 1)
+        st.session_state.next_task_id = task['id'] + 1
         task['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         task['completed'] = False
-        
-        st.session_state.tasks.append(task)
+
+        tasks[task['id']] = task
 
     def get_tasks(self):
-        return st.session_state.get('tasks', [])
+        return list(st.session_state.get('tasks', {}).values())
 
     def update_task(self, task_id, updates):
-        tasks = st.session_state.get('tasks', [])
-        for task in tasks:
-            if task['id'] == task_id:
-                task.update(updates)
-                break
+        task = st.session_state.get('tasks', {}).get(task_id)
+        if task is not None:
+            task.update(updates)
+
+    def delete_task(self, task_id):
+        st.session_state.get('tasks', {}).pop(task_id, None)
+
+def queue_task_update(stored, updated):
+    """Queue a change to a stored task; toggling back to the stored state drops it"""
+    pending = st.session_state.setdefault('pending_task_updates', {})
+    if updated == stored:
+        pending.pop(stored['id'], None)
+    else:
+        pending[stored['id']] = (stored, updated)
+    st.session_state.task_updates_queued_at = clock.monotonic()
+
+def write_task_updates(storage_service: StorageService, user_id) -> bool:
+    """Write the session's queued task changes in one commit; they stay queued if it fails"""
+    pending = st.session_state.get('pending_task_updates')
+    if not pending:
+        return True
+    if storage_service.update_tasks_bulk(user_id, list(pending.values())):
+        pending.clear()
+        return True
+    return False
+
+@st.fragment(run_every=TASK_FLUSH_SECONDS)
+def flush_task_updates(storage_service: StorageService, user_id):
+    """Write queued status changes in one commit once toggling has paused"""
+    queued_at = st.session_state.get('task_updates_queued_at', 0)
+    if (st.session_state.get('pending_task_updates')
+            and clock.monotonic() - queued_at >= TASK_FLUSH_SECONDS):
+        write_task_updates(storage_service, user_id)
+        st.session_state.task_prefetch = storage_service.prefetch_tasks(user_id)
 
 def render_task_manager(storage_service: StorageService):
     """Main function to render the task manager interface"""
@@ -112,7 +340,7 @@ def render_task_manager(storage_service: StorageService):
 
     # Initialize task list in session state if not exists
     if 'tasks' not in st.session_state:
-        st.session_state.tasks = []
+        st.session_state.tasks = {}
 
     # Add new task
     with st.form("new_task_form", clear_on_submit=True):
@@ -122,73 +350,113 @@ def render_task_manager(storage_service: StorageService):
         due_date = st.date_input("Due Date")
         
         if st.form_submit_button("Add Task"):
+            # One clock read serves both the id and the stored timestamp
+            created = now_ns()
             new_task = {
-                "id": str(datetime.now().timestamp()),  # Add unique ID
+                "id": str(created / 1e9),  # Add unique ID
                 "title": task_title,
                 "description": task_description,
                 "priority": task_priority,
                 "due_date": due_date.isoformat(),
                 "status": "pending",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": created
             }
             
-            # Save to storage
+            # Queue the task and write everything queued in one commit; tasks
+            # from a failed write stay queued for the next add or logout
             user_id = st.session_state.get('user_id')
             if user_id:
-                try:
-                    storage_service.save_task_entry(user_id, new_task)
+                pending = st.session_state.setdefault('pending_task_history', [])
+                pending.append(new_task)
+                if storage_service.save_tasks_bulk(user_id, pending):
+                    st.session_state.pending_task_history = []
+                    st.session_state.task_prefetch = storage_service.prefetch_tasks(user_id)
                     st.success("Task added successfully!")
-                except Exception as e:
-                    st.error(f"Error saving task: {str(e)}")
+                else:
+                    st.error("Error saving task, it will be retried with the next change")
 
     # Display tasks
     st.subheader("Your Tasks")
     
     # Get tasks from storage
     user_id = st.session_state.get('user_id')
+    tasks = []
     if user_id:
+        flush_task_updates(storage_service, user_id)
+
+        # A write on the last run started rereading the tasks; wait for it
+        # rather than issuing the same read again
+        prefetch = st.session_state.pop('task_prefetch', None)
+        if prefetch is not None:
+            try:
+                prefetch.result(timeout=2)
+            except FuturesTimeout:
+                pass
+            except Exception as e:
+                # The prefetch thread only logged it; the read below retries
+                st.warning(f"Error fetching tasks: {str(e)}")
         try:
-            user_data = storage_service.get_user_history(user_id)
-            tasks = user_data.get('task_history', [])
-            
-            if not tasks:
+            # Pending tasks feed the schedule generator below
+            tasks = storage_service.get_cached_tasks(user_id, status="pending")
+
+            # Filter options
+            status_filter = st.selectbox("Filter by Status", ["All", "Pending", "Completed"])
+            priority_filter = st.selectbox("Filter by Priority", ["All", "High", "Medium", "Low"])
+            status = None if status_filter == "All" else status_filter
+            priority = None if priority_filter == "All" else priority_filter
+
+            # Changing a filter starts again from the first page
+            if st.session_state.get('task_page_filters') != (status, priority):
+                st.session_state.task_page_filters = (status, priority)
+                st.session_state.task_cursor = 0
+            cursor = st.session_state.get('task_cursor', 0)
+
+            page, next_cursor = storage_service.list_tasks(
+                user_id, status, priority, limit=TASK_PAGE_SIZE, cursor=cursor
+            )
+
+            if not page and not cursor:
                 st.info("No tasks found. Add some tasks to get started!")
-            else:
-                # Filter options
-                status_filter = st.selectbox("Filter by Status", ["All", "Pending", "Completed"])
-                priority_filter = st.selectbox("Filter by Priority", ["All", "High", "Medium", "Low"])
-                
-                # Apply filters
-                filtered_tasks = tasks
-                if status_filter != "All":
-                    filtered_tasks = [t for t in filtered_tasks if t['status'].lower() == status_filter.lower()]
-                if priority_filter != "All":
-                    filtered_tasks = [t for t in filtered_tasks if t['priority'] == priority_filter]
-                
-                # Display tasks
-                for index, task in enumerate(filtered_tasks):
-                    # Create a unique key using index and timestamp
-                    unique_key = f"{task['timestamp']}_{index}"
-                    
-                    with st.expander(f"{task['title']} ({task['priority']})"):
-                        st.write(f"Description: {task['description']}")
-                        st.write(f"Due Date: {task['due_date']}")
-                        st.write(f"Status: {task['status']}")
-                        
-                        # Status update button with unique key
-                        new_status = "completed" if task['status'] == "pending" else "pending"
-                        if st.button(f"Mark as {new_status}", 
-                                   key=f"status_{unique_key}"):  # Using unique key
-                            task['status'] = new_status
-                            storage_service.update_task_status(user_id, task)
-                            st.rerun()
-                        
-                        # Delete button with unique key
-                        if st.button("Delete Task", 
-                                   key=f"delete_{unique_key}"):  # Using unique key
-                            storage_service.delete_task(user_id, task)
-                            st.rerun()
-                            
+
+            # Display tasks
+            pending_updates = st.session_state.setdefault('pending_task_updates', {})
+            for index, stored in enumerate(page):
+                # Show status changes still waiting to be written
+                task = pending_updates.get(stored['id'], (stored, stored))[1]
+                # Create a unique key using index and timestamp
+                unique_key = f"{task['timestamp']}_{cursor + index}"
+
+                with st.expander(f"{task['title']} ({task['priority']})"):
+                    st.write(f"Description: {task['description']}")
+                    st.write(f"Due Date: {task['due_date']}")
+                    st.write(f"Status: {task['status']}")
+
+                    # Status update button with unique key
+                    new_status = "completed" if task['status'] == "pending" else "pending"
+                    if st.button(f"Mark as {new_status}", 
+                               key=f"status_{unique_key}"):  # Using unique key
+                        queue_task_update(stored, {**task, 'status': new_status})
+                        st.rerun()
+
+                    # Delete button with unique key
+                    if st.button("Delete Task", 
+                               key=f"delete_{unique_key}"):  # Using unique key
+                        pending_updates.pop(stored['id'], None)
+                        storage_service.delete_task(user_id, stored)
+                        st.session_state.task_prefetch = storage_service.prefetch_tasks(user_id)
+                        st.rerun()
+
+            # Pagination
+            col1, col2 = st.columns(2)
+            with col1:
+                if cursor and st.button("⬅️ Previous", key="tasks_prev"):
+                    st.session_state.task_cursor = max(cursor - TASK_PAGE_SIZE, 0)
+                    st.rerun()
+            with col2:
+                if next_cursor is not None and st.button("Next ➡️", key="tasks_next"):
+                    st.session_state.task_cursor = next_cursor
+                    st.rerun()
+
         except Exception as e:
             st.error(f"Error loading tasks: {str(e)}")
             st.info("Using local storage as fallback")
@@ -197,7 +465,7 @@ def render_task_manager(storage_service: StorageService):
     st.subheader("📅 Generate Daily Schedule")
     
     # Get active tasks
-    active_tasks = [t for t in tasks if t['status'] == 'pending']
+    active_tasks = tasks
     
     if not active_tasks:
         st.info("Add some pending tasks to generate a schedule!")
@@ -205,42 +473,44 @@ def render_task_manager(storage_service: StorageService):
         with st.expander("Schedule Preferences"):
             col1, col2 = st.columns(2)
             with col1:
-                work_start = st.time_input("Work Start Time", value=datetime.strptime("09:00", "%H:%M").time())
-                work_end = st.time_input("Work End Time", value=datetime.strptime("17:00", "%H:%M").time())
+                work_start = st.time_input("Work Start Time", value=DEFAULT_WORK_START)
+                work_end = st.time_input("Work End Time", value=DEFAULT_WORK_END)
             with col2:
                 break_duration = st.number_input("Break Duration (minutes)", min_value=5, max_value=60, value=15)
                 preferred_task_duration = st.number_input("Preferred Task Duration (minutes)", 
                                                         min_value=15, max_value=180, value=45)
 
+        if len(active_tasks) > SCHEDULE_MAX_TASKS:
+            st.caption(f"The schedule covers your {SCHEDULE_MAX_TASKS} most urgent pending tasks.")
+
         if st.button("Generate Schedule"):
-            with st.spinner("Generating optimal schedule..."):
-                # Prepare tasks for AI
-                task_list = [{
-                    "title": task['title'],
-                    "description": task['description'],
-                    "priority": task['priority'],
-                    "due_date": task['due_date']
-                } for task in active_tasks]
-
-                preferences = {
-                    "work_start": work_start.strftime("%H:%M"),
-                    "work_end": work_end.strftime("%H:%M"),
-                    "break_duration": break_duration,
-                    "preferred_task_duration": preferred_task_duration
-                }
+            # Prepare tasks for AI
+            task_list = [{
+                "title": task['title'],
+                "description": task['description'],
+                "priority": task['priority'],
+                "due_date": task['due_date']
+            } for task in active_tasks]
+
+            preferences = {
+                "work_start": work_start.strftime("%H:%M"),
+                "work_end": work_end.strftime("%H:%M"),
+                "break_duration": break_duration,
+                "preferred_task_duration": preferred_task_duration
+            }
+
+            # Stream the schedule into the page as it is generated
+            task_manager = TaskManager()
+            schedule = task_manager.generate_schedule(task_list, preferences, container=st.container())
 
-                # Generate schedule using TaskManager's generate_schedule method
-                schedule = task_manager.generate_schedule(task_list, preferences)
-                
-                if schedule:
-                    st.success("Schedule generated successfully!")
-                    st.markdown(schedule)
-                    
-                    # Save generated schedule
-                    schedule_data = {
-                        "date": datetime.now().date().isoformat(),
-                        "tasks": task_list,
-                        "preferences": preferences,
-                        "generated_schedule": schedule
-                    }
-                    storage_service.save_schedule(user_id, schedule_data) 
\ No newline at end of file
+            if schedule:
+                st.success("Schedule generated successfully!")
+
+                # Save generated schedule
+                schedule_data = {
+                    "date": datetime.now().date().isoformat(),
+                    "tasks": task_list,
+                    "preferences": preferences,
+                    "generated_schedule": schedule
+                }
+                storage_service.save_schedule(user_id, schedule_data) 
\ No newline at end of file
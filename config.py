@@ -17,8 +17,9 @@ FIREBASE_CONFIG = {
     "appId": os.getenv("FIREBASE_APP_ID"),
 }
 
+@st.cache_resource(show_spinner=False)
 def initialize_firebase():
-    """Initialize Firebase with error handling"""
+    """Initialize Firebase once per process with error handling"""
     try:
         if not firebase_admin._apps:
             cred = credentials.Certificate("firebase-credentials.json")
@@ -31,18 +32,6 @@ def initialize_firebase():
 # Initialize Firestore with error handling
 db = initialize_firebase()
 
-# Function to check if Firestore is working
-def is_firestore_available():
-    """Check if Firestore is available and working"""
-    if not db:
-        return False
-    try:
-        # Try a simple operation
-        db.collection('test').limit(1).get()
-        return True
-    except Exception:
-        return False
-
 # OpenRouter/LLM Configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
@@ -67,6 +56,9 @@ TASK_PRIORITIES = [
     "Low"
 ]
 
+# Tasks shown per page in the task manager
+TASK_PAGE_SIZE = 50
+
 # Pomodoro Settings
 POMODORO_WORK_MINUTES = 25
 POMODORO_BREAK_MINUTES = 5
@@ -77,6 +69,9 @@ POMODORO_SESSIONS_BEFORE_LONG_BREAK = 4
 MAX_POST_LENGTH = 500
 MIN_REPORTS_FOR_REVIEW = 3
 
+# Session History Settings (older in-session entries age out past this)
+MAX_LOCAL_HISTORY = 2000
+
 # Emergency Contacts
 EMERGENCY_CONTACTS = {
     "National Crisis Line": "988",
@@ -1,16 +1,34 @@
-import firebase_admin
-from firebase_admin import auth, credentials
+from firebase_admin import auth
 import jwt
 import datetime
+import threading
+import time
+from collections import OrderedDict
 import streamlit as st
 from typing import Optional, Dict, Any
 
+# Session tokens are HS256 JWTs keyed by the Firebase API key
+JWT_ALGORITHM = "HS256"
+JWT_ALGORITHMS = [JWT_ALGORITHM]
+SESSION_TOKEN_LIFETIME = datetime.timedelta(days=7)
+
+# verify_session reuses a user record fetched this recently
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 10000
+
 class AuthService:
     def __init__(self, firebase_config: Dict[str, Any]):
         self.config = firebase_config
-        if not firebase_admin._apps:
-            cred = credentials.Certificate("firebase-credentials.json")
-            firebase_admin.initialize_app(cred)
+        # Encode the signing key once instead of on every token operation
+        api_key = firebase_config.get("apiKey")
+        self._jwt_key = api_key.encode("utf-8") if api_key else None
+        # One codec per service, reused by every token operation
+        self._jwt_codec = jwt.PyJWT()
+        self._user_cache: OrderedDict = OrderedDict()
+        self._user_cache_lock = threading.Lock()
+        # Reuse the process-wide app from config instead of parsing the certificate again
+        from config import initialize_firebase
+        initialize_firebase()
 
     def create_user(self, email: str, password: str, display_name: str) -> Dict[str, Any]:
         """Create a new user and send verification email"""
@@ -75,12 +93,12 @@ class AuthService:
 
     def _create_session_token(self, user_id: str) -> str:
         """Create a JWT session token"""
-        expiry = datetime.datetime.now() + datetime.timedelta(days=7)
+        expiry = datetime.datetime.now() + SESSION_TOKEN_LIFETIME
         payload = {
             "user_id": user_id,
             "exp": expiry
         }
-        return jwt.encode(payload, self.config["apiKey"], algorithm="HS256")
+        return self._jwt_codec.encode(payload, self._jwt_key, algorithm=JWT_ALGORITHM)
 
     def verify_session(self, session_token: Optional[str]) -> Dict[str, Any]:
         """Verify session token"""
@@ -88,8 +106,11 @@ class AuthService:
             return {"valid": False}
         
         try:
-            payload = jwt.decode(session_token, self.config["apiKey"], algorithms=["HS256"])
-            user = auth.get_user(payload["user_id"])
+            payload = self._jwt_codec.decode(
+                session_token, self._jwt_key, algorithms=JWT_ALGORITHMS,
+                options={"require": ["exp"]}
+            )
+            user = self._get_user_cached(payload["user_id"])
             return {
                 "valid": True,
                 "user": user
@@ -97,7 +118,35 @@ class AuthService:
         except Exception:
             return {"valid": False}
 
+    def _get_user_cached(self, user_id: str):
+        """auth.get_user, answered from a short-lived LRU so reruns skip the RPC"""
+        now = time.monotonic()
+        with self._user_cache_lock:
+            entry = self._user_cache.get(user_id)
+            if entry is not None and now - entry[0] <= USER_CACHE_TTL:
+                self._user_cache.move_to_end(user_id)
+                return entry[1]
+
+        user = auth.get_user(user_id)
+        with self._user_cache_lock:
+            self._user_cache[user_id] = (now, user)
+            self._user_cache.move_to_end(user_id)
+            while len(self._user_cache) > USER_CACHE_SIZE:
+                self._user_cache.popitem(last=False)
+        return user
+
     def logout_user(self) -> None:
         """Clear user session"""
+        token = st.session_state.get("session_token")
+        if token:
+            try:
+                payload = self._jwt_codec.decode(
+                    token, self._jwt_key, algorithms=JWT_ALGORITHMS,
+                    options={"verify_exp": False}
+                )
+                with self._user_cache_lock:
+                    self._user_cache.pop(payload.get("user_id"), None)
+            except Exception:
+                pass
         if "session_token" in st.session_state:
             del st.session_state.session_token 
\ No newline at end of file
@@ -0,0 +1,21 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Hashable
+
+class KeyedExecutor:
+    """Thread pool that runs at most one task per key at a time"""
+
+    def __init__(self, max_workers: int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """Start fn in the background unless a task for key is still running"""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not future.done():
+                return future
+            future = self._pool.submit(fn, *args, **kwargs)
+            self._futures[key] = future
+            return future
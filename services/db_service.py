@@ -3,15 +3,18 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
 class DatabaseService:
-    def __init__(self):
-        self.db = firestore.client()
+    def __init__(self, db=None):
+        # Share the process-wide client from config instead of opening another
+        if db is None:
+            from config import db
+        self.db = db
 
     def create_user_profile(self, user_id: str, data: Dict[str, Any]) -> bool:
         """Create new user profile in Firestore"""
         try:
             self.db.collection('users').document(user_id).set({
                 **data,
-                'created_at': datetime.now(),
+                'created_at': firestore.SERVER_TIMESTAMP,
                 'mood_history': [],
                 'focus_history': [],
                 'task_history': [],
@@ -82,18 +85,46 @@ class DatabaseService:
     def delete_mood_entry(self, user_id: str, entry_timestamp: datetime) -> bool:
         """Delete specific mood entry"""
         try:
-            doc_ref = self.db.collection('users').document(user_id)
-            doc = doc_ref.get()
+            doc = self.db.collection('users').document(user_id).get(field_paths=['mood_history'])
             if not doc.exists:
                 return False
 
-            mood_history = doc.to_dict().get('mood_history', [])
-            mood_history = [
-                entry for entry in mood_history
-                if entry['timestamp'] != entry_timestamp
+            # Remove the matching elements server-side so entries appended
+            # since the read are kept and only the matches are sent back
+            matches = [
+                entry for entry in doc.to_dict().get('mood_history', [])
+                if entry['timestamp'] == entry_timestamp
             ]
+            return self.delete_mood_entries(user_id, matches)
+        except Exception:
+            return False
+
+    def delete_mood_entries(self, user_id: str, entries: List[Dict[str, Any]]) -> bool:
+        """Delete several mood entries in one commit without rereading the history"""
+        if not entries:
+            return True
+        try:
+            batch = self.db.batch()
+            batch.update(self.db.collection('users').document(user_id), {
+                'mood_history': firestore.ArrayRemove(list(entries))
+            })
+            batch.commit()
+            return True
+        except Exception:
+            return False
 
-            doc_ref.update({'mood_history': mood_history})
+    def save_tasks_bulk(self, user_id: str, tasks: List[Dict[str, Any]]) -> bool:
+        """Save several task entries in one commit"""
+        if not tasks:
+            return True
+        try:
+            batch = self.db.batch()
+            batch.update(self.db.collection('users').document(user_id), {
+                'task_history': firestore.ArrayUnion([
+                    {**task, 'timestamp': datetime.now()} for task in tasks
+                ])
+            })
+            batch.commit()
             return True
         except Exception:
-            return False 
\ No newline at end of file
+            return False
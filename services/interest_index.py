@@ -0,0 +1,50 @@
+import threading
+from typing import Dict, Iterable, Set
+
+# Trie node key holding the ids of every user with a token under that node
+_IDS = '$ids'
+
+class InterestIndex:
+    """Prefix trie from lowercase interest tokens to the ids of users listing them"""
+
+    def __init__(self):
+        self._root: Dict = {_IDS: set()}
+        self._interests: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(interest: str) -> str:
+        return interest.strip().lower()
+
+    def set_interests(self, user_id: str, interests: Iterable[str]):
+        """Replace a user's indexed interests"""
+        tokens = {self.normalize(i) for i in interests if i and i.strip()}
+        with self._lock:
+            for token in self._interests.pop(user_id, set()):
+                self._walk(token, lambda ids: ids.discard(user_id))
+            for token in tokens:
+                self._walk(token, lambda ids: ids.add(user_id), create=True)
+            if tokens:
+                self._interests[user_id] = tokens
+
+    def lookup(self, prefix: str) -> Set[str]:
+        """Ids of users with an interest starting with prefix, in O(len(prefix))"""
+        node = self._root
+        with self._lock:
+            for char in self.normalize(prefix):
+                node = node.get(char)
+                if node is None:
+                    return set()
+            return set(node[_IDS])
+
+    def _walk(self, token: str, apply, create: bool = False):
+        node = self._root
+        apply(node[_IDS])
+        for char in token:
+            child = node.get(char)
+            if child is None:
+                if not create:
+                    return
+                child = node[char] = {_IDS: set()}
+            node = child
+            apply(node[_IDS])
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterator, Optional
+import streamlit as st
+from groq import Groq
+
+# Resolved once found; a missing key is looked up again so adding it takes effect
+_groq_api_key: Optional[str] = None
+
+def groq_api_key() -> Optional[str]:
+    """GROQ_API_KEY from the environment, else from secrets, or None if unset"""
+    global _groq_api_key
+    if _groq_api_key is None:
+        _groq_api_key = os.getenv("GROQ_API_KEY")
+        if not _groq_api_key and "GROQ_API_KEY" in st.secrets:
+            _groq_api_key = st.secrets["GROQ_API_KEY"]
+    return _groq_api_key
+
+@st.cache_resource(show_spinner=False)
+def get_groq_client(api_key: str) -> Groq:
+    """One Groq client per key and process, so its connection pool survives reruns"""
+    return Groq(api_key=api_key)
+
+def stream_text(response) -> Iterator[str]:
+    """Yield the text deltas of a streamed chat completion as they arrive"""
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+class ResponseCache:
+    """Process-wide LRU of completed LLM responses with a time-to-live"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, text = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: Hashable, text: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
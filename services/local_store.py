@@ -0,0 +1,186 @@
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import orjson
+
+# Naive datetimes are written as UTC, as readers assume, and non-string keys
+# are stringified instead of failing the whole save
+LOCAL_DATA_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+# List fields kept one entry per line, so adding an entry is an append
+APPEND_FIELDS = ('mood_history', 'focus_history', 'task_history', 'chat_history', 'schedules')
+
+# Everything else in a user's data lives in this document
+DOC_FILE = 'doc.json'
+
+# Files at least this large are read through mmap; below it setup costs more than it saves
+MMAP_MIN_BYTES = 64 * 1024
+
+# Parsed users kept in memory
+LOCAL_CACHE_SIZE = 128
+
+def default_user_data() -> Dict:
+    return {
+        'mood_history': [],
+        'focus_history': [],
+        'task_history': [],
+        'chat_history': [],
+        'settings': {'theme': 'light'}
+    }
+
+def local_copy(data: Dict) -> Dict:
+    """Copy a user document's top-level lists and dicts, which callers change in place"""
+    return {
+        key: list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value
+        for key, value in data.items()
+    }
+
+def dump_line(entry) -> bytes:
+    return orjson.dumps(entry, default=str, option=LOCAL_DATA_OPTIONS) + b'\n'
+
+def read_ndjson(path: str) -> List:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+            return [orjson.loads(line) for line in f.read().splitlines() if line]
+        # Large files are parsed line by line straight from the page cache
+        # instead of being copied into one buffer and split again
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [orjson.loads(line) for line in iter(mm.readline, b'') if line.strip()]
+
+def write_file(path: str, payload: bytes):
+    """Replace a file's contents atomically, so readers never see a partial write"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+class LocalStore:
+    """Per-user local files: NDJSON for history lists, one JSON document for the rest"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # user_id -> (signature of the user's files, parsed data)
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, f"user_{user_id}")
+
+    def _legacy_path(self, user_id: str) -> str:
+        """Single-file layout used before per-field files; migrated on the next save"""
+        return os.path.join(self.root, f"user_{user_id}.json")
+
+    def _signature(self, user_id: str) -> Optional[Tuple]:
+        """Name, mtime and size of each of the user's files, or None without a directory"""
+        try:
+            with os.scandir(self._user_dir(user_id)) as entries:
+                stats = [(entry.name, entry.stat()) for entry in entries]
+        except FileNotFoundError:
+            return None
+        return tuple(sorted((name, st.st_mtime_ns, st.st_size) for name, st in stats))
+
+    def _remember(self, user_id: str, signature: Optional[Tuple], data: Dict):
+        if signature is None:
+            return
+        self._cache[user_id] = (signature, data)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > LOCAL_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def _read(self, user_id: str) -> Dict:
+        user_dir = self._user_dir(user_id)
+        try:
+            with open(os.path.join(user_dir, DOC_FILE), 'rb') as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            data = {}
+        for field in APPEND_FIELDS:
+            path = os.path.join(user_dir, f"{field}.ndjson")
+            if os.path.exists(path):
+                data[field] = read_ndjson(path)
+        return data
+
+    def load(self, user_id: str) -> Dict:
+        """A user's data, reparsed only after their files change"""
+        with self._lock:
+            signature = self._signature(user_id)
+            if signature is None:
+                legacy_path = self._legacy_path(user_id)
+                if os.path.exists(legacy_path):
+                    with open(legacy_path, 'rb') as f:
+                        return orjson.loads(f.read())
+                return default_user_data()
+
+            cached = self._cache.get(user_id)
+            if cached is None or cached[0] != signature:
+                cached = (signature, self._read(user_id))
+                self._remember(user_id, *cached)
+            else:
+                self._cache.move_to_end(user_id)
+            return local_copy(cached[1])
+
+    def save(self, user_id: str, data: Dict):
+        """Rewrite all of a user's files from data"""
+        user_dir = self._user_dir(user_id)
+        with self._lock:
+            os.makedirs(user_dir, exist_ok=True)
+            doc = {}
+            # Cache what a reload would return, decoded from the bytes written
+            stored = {}
+            for key, value in data.items():
+                if key in APPEND_FIELDS and isinstance(value, list):
+                    lines = [dump_line(entry) for entry in value]
+                    write_file(os.path.join(user_dir, f"{key}.ndjson"), b''.join(lines))
+                    stored[key] = [orjson.loads(line) for line in lines]
+                else:
+                    doc[key] = value
+            for field in APPEND_FIELDS:
+                path = os.path.join(user_dir, f"{field}.ndjson")
+                if field not in stored and os.path.exists(path):
+                    os.remove(path)
+            payload = orjson.dumps(doc, default=str, option=LOCAL_DATA_OPTIONS)
+            write_file(os.path.join(user_dir, DOC_FILE), payload)
+            stored.update(orjson.loads(payload))
+
+            legacy_path = self._legacy_path(user_id)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+            self._remember(user_id, self._signature(user_id), stored)
+
+    def delete(self, user_id: str):
+        """Remove all of a user's files, including a not yet migrated legacy file"""
+        with self._lock:
+            shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+            legacy_path = self._legacy_path(user_id)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+            self._cache.pop(user_id, None)
+
+    def append(self, user_id: str, field: str, entries: Iterable):
+        """Add entries to a history list by appending lines, without rewriting it"""
+        entries = list(entries)
+        if field not in APPEND_FIELDS:
+            raise ValueError(f"{field} is not an append-only field")
+        with self._lock:
+            signature = self._signature(user_id)
+        if signature is None:
+            # First write for this user, or a legacy file still to migrate
+            data = self.load(user_id)
+            data.setdefault(field, []).extend(entries)
+            self.save(user_id, data)
+            return
+
+        lines = [dump_line(entry) for entry in entries]
+        with self._lock:
+            cached = self._cache.get(user_id)
+            current = cached is not None and cached[0] == self._signature(user_id)
+            with open(os.path.join(self._user_dir(user_id), f"{field}.ndjson"), 'ab') as f:
+                f.write(b''.join(lines))
+            if current:
+                # Extend the cached copy so the next load does not reparse
+                cached[1].setdefault(field, []).extend(orjson.loads(line) for line in lines)
+                self._remember(user_id, self._signature(user_id), cached[1])
@@ -1,86 +1,532 @@
-import json
+import logging
 import os
+import queue
+import re
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Tuple
 from firebase_admin import firestore, auth
 import streamlit as st
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
-import random
-import string
-import pandas as pd
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import atexit
+import bisect
+import time
+import heapq
+import orjson
+from services.interest_index import InterestIndex
+from services.local_store import LocalStore, write_file
+from services.timestamps import now_ns, to_utc_datetime, to_utc_series
+
+logger = logging.getLogger(__name__)
+
+# smtplib, email.mime and secrets are only needed on the signup path, so they
+# are imported where used instead of on every cold start
+
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+
+# Verification code shape, computed once instead of per call
+OTP_LENGTH = 6
+# Seconds verify_otp waits for a still-running background send
+OTP_SEND_TIMEOUT = 15
+_OTP_RANGE = 10 ** OTP_LENGTH
+_OTP_FORMAT = f"{{:0{OTP_LENGTH}d}}"
+
+# Seconds before the buddy interest index is rebuilt from Firestore
+INTEREST_INDEX_TTL = 600
+
+# Verification email parts that don't change between sends
+OTP_EMAIL_SUBJECT = "MindSpace - Your Verification Code"
+OTP_EMAIL_HTML = """
+<div style="padding: 20px; background-color: #f9f9f9;">
+    <h2>Your MindSpace Verification Code</h2>
+    <div style="font-size: 24px; padding: 20px; background-color: #ffffff; margin: 20px 0;">
+        <strong>{otp}</strong>
+    </div>
+    <p>This code will expire in 10 minutes.</p>
+</div>
+"""
+
+# Seconds a connection may sit unused before a send health-checks it first
+SMTP_IDLE_CHECK_SECONDS = 30
+
+class SMTPConnection:
+    """Authenticated SMTP session shared across verification emails"""
+
+    def __init__(self, server: str, port: int, timeout: int = 30):
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self._smtp = None
+        self._credentials = None
+        self._last_used = float('-inf')
+        self._lock = threading.Lock()
+        atexit.register(self.quit)
+
+    def _connect(self, sender_email: str, sender_password: str):
+        """Open the connection and run STARTTLS + login once"""
+        import smtplib
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        smtp.starttls()
+        smtp.login(sender_email, sender_password)
+        self._smtp = smtp
+        self._credentials = (sender_email, sender_password)
+
+    def _is_alive(self) -> bool:
+        """Health check the cached connection with NOOP"""
+        if self._smtp is None:
+            return False
+        import smtplib
+        try:
+            return self._smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self):
+        if self._smtp is not None:
+            import smtplib
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._smtp = None
+        self._credentials = None
+
+    def send_message(self, msg, sender_email: str, sender_password: str):
+        """Send a message, reconnecting and retrying once on SMTP failures"""
+        import smtplib
+        with self._lock:
+            # A connection used moments ago skips the NOOP round-trip; a dead
+            # one still fails the send below and is reopened
+            idle = time.monotonic() - self._last_used > SMTP_IDLE_CHECK_SECONDS
+            if self._credentials != (sender_email, sender_password) or (idle and not self._is_alive()):
+                self._close()
+                self._connect(sender_email, sender_password)
+            try:
+                self._smtp.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPException):
+                self._close()
+                self._connect(sender_email, sender_password)
+                self._smtp.send_message(msg)
+            self._last_used = time.monotonic()
+
+    def quit(self):
+        """Close the cached connection"""
+        with self._lock:
+            self._close()
+
+# One authenticated connection per process, reused by every OTP email
+_smtp_connection = SMTPConnection(SMTP_SERVER, SMTP_PORT)
+
+# Background workers for email delivery; sends queue onto the shared connection
+_EMAIL_POOL = ThreadPoolExecutor(max_workers=2)
+
+# History length above which timestamp filters switch to pandas
+VECTORIZE_MIN_ENTRIES = 500
+
+# Most recent buddy chat messages loaded per render
+BUDDY_MESSAGE_LIMIT = 100
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+# Seconds a Firestore availability probe result is reused, and the probe's deadline
+FIRESTORE_CHECK_TTL = 30
+FIRESTORE_CHECK_TIMEOUT = 2.0
+
+# Last probe result shared with other processes and restarts, under the local data root
+FIRESTORE_STATUS_FILE = '.fs_status'
+
+# Seconds the background writer waits for more entries before committing what it has
+WRITE_COALESCE_SECONDS = 0.05
+# Backoff before re-queueing entries no backend accepted: doubles per attempt up to the cap
+WRITE_RETRY_SECONDS = 1.0
+WRITE_RETRY_MAX_SECONDS = 60.0
+# Seconds flush_writes waits at exit for queued and retried entries
+WRITE_FLUSH_TIMEOUT = 30.0
+
+# Firestore reads overlapped with other work; the client is thread-safe
+_READ_POOL = ThreadPoolExecutor(max_workers=8)
+
+# Rereads a user's tasks after a write while the page reruns
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=2)
+
+def generate_otp() -> str:
+    """Generate an OTP_LENGTH-digit verification code with a single CSPRNG call"""
+    import secrets
+    return _OTP_FORMAT.format(secrets.randbelow(_OTP_RANGE))
+
+def hash_otp(email: str, otp: str) -> str:
+    """Hash a code with its email so stored OTP records never hold the plaintext"""
+    import hashlib
+    return hashlib.sha256(f"{email.lower()}:{otp}".encode()).hexdigest()
+
+def otp_matches(otp_data: Dict, email: str, otp: str) -> bool:
+    """Compare a submitted code against a stored OTP record in constant time"""
+    import hmac
+    return hmac.compare_digest(otp_data.get('otp_hash', ''), hash_otp(email, otp.strip()))
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_user_history(_storage, user_id: str, synced_at: float, days: Optional[int], mood_filter) -> Dict[str, Any]:
+    """Memoize a history read until the user's data next changes"""
+    return _storage.get_user_history(user_id, days, mood_filter)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_focus_index(_storage, user_id: str, synced_at: float) -> Dict[str, Any]:
+    """Memoize a user's indexed focus sessions until their data next changes"""
+    data = _storage.get_focus_data(user_id)
+    return index_focus_sessions(data.get('focus_history', []), data.get('focus_stats'))
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_tasks(_storage, user_id: str, synced_at: float) -> Dict[Tuple, List[Dict]]:
+    """Memoize a user's grouped tasks until their data next changes; errors raise and are not cached"""
+    return group_tasks(_storage._read_task_data(user_id))
+
+def _prefetch_tasks(storage, user_id: str, synced_at: float):
+    """_cached_tasks for the prefetch pool, which has no page to warn on"""
+    try:
+        return _cached_tasks(storage, user_id, synced_at)
+    except Exception:
+        logger.exception("Prefetching tasks for user %s failed", user_id)
+        raise
+
+def _task_created_at(task: Dict) -> datetime:
+    return to_utc_datetime(task.get('timestamp')) or datetime.min.replace(tzinfo=timezone.utc)
+
+def group_tasks(tasks: List[Dict]) -> Dict[Tuple, List[Dict]]:
+    """Newest-first task lists for every (status, priority) filter, None matching any, in one pass"""
+    groups: Dict[Tuple, List[Dict]] = {(None, None): []}
+    # Sorted by creation time, not array position: Firestore updates swap a task
+    # with ArrayRemove + ArrayUnion, which moves it to the end of task_history
+    for task in sorted(reversed(tasks), key=_task_created_at, reverse=True):
+        status = task.get('status', '').lower()
+        priority = task.get('priority')
+        # dict.fromkeys drops repeats when the task has no status or priority
+        for key in dict.fromkeys(((None, None), (status, None), (None, priority), (status, priority))):
+            groups.setdefault(key, []).append(task)
+    return groups
+
+def sorted_timestamps(history: List[Dict]) -> Optional[List]:
+    """Parsed timestamps of history when every one parses and none decreases, else None"""
+    if len(history) > VECTORIZE_MIN_ENTRIES:
+        parsed = to_utc_series([e.get('timestamp') for e in history])
+        if parsed.notna().all() and parsed.is_monotonic_increasing:
+            return list(parsed)
+        return None
+    parsed = [to_utc_datetime(e.get('timestamp')) for e in history]
+    if None in parsed or any(a > b for a, b in zip(parsed, parsed[1:])):
+        return None
+    return parsed
+
+def task_tokens(text: str) -> Set[str]:
+    """Lowercase word tokens used to index and search focus task names"""
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+def focus_stats_of(sessions: List[Dict]) -> Dict[str, Any]:
+    """Totals over finished sessions, for documents written before focus_stats existed"""
+    finished = [s for s in sessions if 'end_time' in s]
+    return {
+        'sessions': len(finished),
+        'minutes': sum(s.get('duration', 0) for s in finished),
+    }
+
+def index_focus_sessions(sessions: List[Dict], stats: Optional[Dict] = None) -> Dict[str, Any]:
+    """Inverted indexes from status and task-name token to session positions, plus totals"""
+    by_status: Dict[str, List[int]] = {}
+    by_token: Dict[str, Set[int]] = {}
+    for i, session in enumerate(sessions):
+        by_status.setdefault(str(session.get('status', '')).lower(), []).append(i)
+        for token in task_tokens(session.get('task', '')):
+            by_token.setdefault(token, set()).add(i)
+    return {
+        'sessions': sessions,
+        'status': by_status,
+        'tokens': by_token,
+        'stats': stats or focus_stats_of(sessions),
+    }
 
 class StorageService:
     def __init__(self, db):
         self.db = db
         self.local_storage_path = "data"
-        self._ensure_local_storage_exists()
-
-    def _ensure_local_storage_exists(self):
-        """Create local storage directory if it doesn't exist"""
-        if not os.path.exists(self.local_storage_path):
-            os.makedirs(self.local_storage_path)
-
-    def _get_user_file_path(self, user_id: str) -> str:
-        """Get path to user's local storage file"""
-        return os.path.join(self.local_storage_path, f"user_{user_id}.json")
+        self._local = LocalStore(self.local_storage_path)
+        self._interest_index = None
+        self._buddy_profiles: Dict[str, Dict] = {}
+        self._interest_index_built_at = 0.0
+        self._interest_index_lock = threading.Lock()
+        # Set once every random-id buddy chat has a keyed alias document
+        self._legacy_chats_aliased = False
+        self._legacy_chats_lock = threading.Lock()
+        # Chats whose pre-subcollection message array is known to be gone
+        self._migrated_chats: Set[str] = set()
+        # Per-user timestamp of the last write, part of the history cache key
+        self._history_synced_at: Dict[str, float] = {}
+        # (user_id, history_type) -> (synced_at, length, sorted timestamps or None)
+        self._timestamp_index: Dict[Tuple[str, str], Tuple[float, int, Optional[List]]] = {}
+        # Entries saved off the request path, committed by one daemon thread;
+        # until then reads overlay them from _unwritten
+        self._write_queue: queue.Queue = queue.Queue()
+        # (due, seq, item) of failed writes; each stays an unfinished queue task until it lands
+        self._retries: List[Tuple[float, int, Tuple]] = []
+        self._retry_seq = 0
+        self._retries_lock = threading.Lock()
+        self._unwritten: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._unwritten_lock = threading.Lock()
+        self._local_locks: Dict[str, threading.RLock] = {}
+        self._local_locks_guard = threading.Lock()
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+        atexit.register(self.flush_writes)
+        # Last availability probe; a failed write resets the time to force a new probe
+        self._firestore_available = False
+        self._firestore_checked_at = float('-inf')
 
     def _load_local_data(self, user_id: str) -> Dict:
         """Load user data from local storage"""
-        file_path = self._get_user_file_path(user_id)
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        return {
-            'mood_history': [],
-            'focus_history': [],
-            'task_history': [],
-            'chat_history': [],
-            'settings': {'theme': 'light'}
-        }
+        return self._local.load(user_id)
 
     def _save_local_data(self, user_id: str, data: Dict):
         """Save user data to local storage"""
-        file_path = self._get_user_file_path(user_id)
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
+        self._local.save(user_id, data)
+
+    def _local_lock(self, user_id: str) -> threading.RLock:
+        """Lock held across a user's local read-modify-write, which the background writer also does"""
+        with self._local_locks_guard:
+            return self._local_locks.setdefault(user_id, threading.RLock())
+
+    def _delete_local_data(self, user_id: str):
+        """Delete user data from local storage"""
+        self._local.delete(user_id)
+
+    def _firestore_succeeded(self):
+        """A completed Firestore call proves availability as well as a probe would"""
+        self._firestore_available = True
+        self._firestore_checked_at = time.monotonic()
+
+    def _firestore_failed(self):
+        """Probe again on the next check instead of trusting the last result"""
+        self._firestore_checked_at = float('-inf')
+        try:
+            os.remove(self._status_path())
+        except OSError:
+            pass
+
+    def _status_path(self) -> str:
+        return os.path.join(self.local_storage_path, FIRESTORE_STATUS_FILE)
+
+    def _read_probe_status(self) -> Optional[bool]:
+        """Another process's unexpired probe result, or None"""
+        try:
+            with open(self._status_path(), 'rb') as f:
+                status = orjson.loads(f.read())
+            if status['exp'] > time.time():
+                return bool(status['ok'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _write_probe_status(self, ok: bool):
+        try:
+            write_file(self._status_path(), orjson.dumps({'ok': ok, 'exp': time.time() + FIRESTORE_CHECK_TTL}))
+        except OSError:
+            pass
 
     def is_firestore_available(self) -> bool:
-        """Check if Firestore is available"""
+        """Check if Firestore is available, probing at most every FIRESTORE_CHECK_TTL seconds"""
+        if not self.db:
+            return False
+        now = time.monotonic()
+        if now - self._firestore_checked_at < FIRESTORE_CHECK_TTL:
+            return self._firestore_available
+        shared = self._read_probe_status()
+        if shared is not None:
+            self._firestore_available = shared
+            self._firestore_checked_at = now
+            return shared
         try:
-            if not self.db:
-                return False
             # Try a simple operation
-            self.db.collection('test').limit(1).get()
+            self.db.collection('test').limit(1).get(retry=None, timeout=FIRESTORE_CHECK_TIMEOUT)
+            self._firestore_available = True
+        except Exception:
+            self._firestore_available = False
+        self._firestore_checked_at = now
+        self._write_probe_status(self._firestore_available)
+        return self._firestore_available
+
+    def _commit_entries(self, user_id: str, pending: Dict[str, List[Dict[str, Any]]]):
+        """Append entries to their history fields in one write; raises on failure"""
+        if self.is_firestore_available():
+            finished = [e for e in pending.get('focus_history', []) if 'end_time' in e]
+            updates = {field: firestore.ArrayUnion(entries) for field, entries in pending.items()}
+            if finished:
+                updates.update({
+                    'focus_stats.sessions': firestore.Increment(len(finished)),
+                    'focus_stats.minutes': firestore.Increment(sum(e.get('duration', 0) for e in finished)),
+                    'focus_stats.last_at': firestore.SERVER_TIMESTAMP,
+                })
+            batch = self.db.batch()
+            batch.update(self.db.collection('users').document(user_id), updates)
+            batch.commit()
+            self._firestore_succeeded()
+        else:
+            self._commit_entries_locally(user_id, pending)
+        self.invalidate_history(user_id)
+
+    def _commit_entries_locally(self, user_id: str, pending: Dict[str, List[Dict[str, Any]]]):
+        finished = [e for e in pending.get('focus_history', []) if 'end_time' in e]
+        with self._local_lock(user_id):
+            if not finished:
+                for field, entries in pending.items():
+                    self._local.append(user_id, field, entries)
+                return
+            data = self._load_local_data(user_id)
+            stats = data.setdefault('focus_stats', focus_stats_of(data.get('focus_history', [])))
+            stats['sessions'] += len(finished)
+            stats['minutes'] += sum(e.get('duration', 0) for e in finished)
+            stats['last_at'] = finished[-1]['end_time']
+            for field, entries in pending.items():
+                data.setdefault(field, []).extend(entries)
+            self._save_local_data(user_id, data)
+
+    def _write_later(self, user_id: str, field: str, entries: List[Dict[str, Any]]) -> bool:
+        """Hand entries to the background writer; reads include them until they are written"""
+        with self._unwritten_lock:
+            self._unwritten.setdefault(user_id, {}).setdefault(field, []).extend(entries)
+        self._write_queue.put((user_id, field, entries, 0))
+        self.invalidate_history(user_id)
+        return True
+
+    def _with_unwritten(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """data with the user's not-yet-written entries appended to their fields"""
+        with self._unwritten_lock:
+            unwritten = {field: list(entries) for field, entries in self._unwritten.get(user_id, {}).items()}
+        if not unwritten:
+            return data
+        data = dict(data)
+        for field, entries in unwritten.items():
+            data[field] = list(data.get(field) or []) + entries
+        finished = [e for e in unwritten.get('focus_history', []) if 'end_time' in e]
+        if finished and data.get('focus_stats'):
+            # Stored totals don't include queued sessions yet
+            stats = dict(data['focus_stats'])
+            stats['sessions'] = stats.get('sessions', 0) + len(finished)
+            stats['minutes'] = stats.get('minutes', 0) + sum(e.get('duration', 0) for e in finished)
+            data['focus_stats'] = stats
+        return data
+
+    def _forget_unwritten(self, user_id: str, written: Dict[str, List[Dict[str, Any]]]):
+        with self._unwritten_lock:
+            fields = self._unwritten.get(user_id, {})
+            for field, entries in written.items():
+                ids = {id(e) for e in entries}
+                remaining = [e for e in fields.get(field, []) if id(e) not in ids]
+                if remaining:
+                    fields[field] = remaining
+                else:
+                    fields.pop(field, None)
+            if not fields:
+                self._unwritten.pop(user_id, None)
+        self.invalidate_history(user_id)
+
+    def _due_retries(self) -> List[Tuple]:
+        now = time.monotonic()
+        due = []
+        with self._retries_lock:
+            while self._retries and self._retries[0][0] <= now:
+                due.append(heapq.heappop(self._retries)[2])
+        return due
+
+    def _retry_wait(self) -> Optional[float]:
+        """Seconds until the next retry is due, or None to block until new work arrives"""
+        with self._retries_lock:
+            if not self._retries:
+                return None
+            return max(0.0, self._retries[0][0] - time.monotonic())
+
+    def _schedule_retries(self, items: List[Tuple]):
+        with self._retries_lock:
+            for user_id, field, entries, attempt in items:
+                delay = min(WRITE_RETRY_SECONDS * 2 ** attempt, WRITE_RETRY_MAX_SECONDS)
+                self._retry_seq += 1
+                heapq.heappush(
+                    self._retries,
+                    (time.monotonic() + delay, self._retry_seq, (user_id, field, entries, attempt + 1)),
+                )
+
+    def _writer_loop(self):
+        """Commit queued entries, one write per user for everything queued within WRITE_COALESCE_SECONDS"""
+        while True:
+            # Retries are not re-put: their original queue task is still unfinished
+            items = self._due_retries()
+            if not items:
+                try:
+                    items = [self._write_queue.get(timeout=self._retry_wait())]
+                except queue.Empty:
+                    continue
+            deadline = time.monotonic() + WRITE_COALESCE_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    items.append(self._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # None only wakes the loop, for flush_writes
+            wakeups = items.count(None)
+            items = [item for item in items if item is not None]
+            failed: List[Tuple] = []
+            try:
+                by_user: Dict[str, List[Tuple]] = {}
+                for item in items:
+                    by_user.setdefault(item[0], []).append(item)
+                for user_id, user_items in by_user.items():
+                    pending: Dict[str, List[Dict[str, Any]]] = {}
+                    for _, field, entries, _ in user_items:
+                        pending.setdefault(field, []).extend(entries)
+                    if not self._write_in_background(user_id, pending):
+                        failed.extend(user_items)
+            finally:
+                self._schedule_retries(failed)
+                # Each item holds one queue task; a retried one keeps it until it is written
+                for _ in range(wakeups + len(items) - len(failed)):
+                    self._write_queue.task_done()
+
+    def _write_in_background(self, user_id: str, pending: Dict[str, List[Dict[str, Any]]]) -> bool:
+        """Commit entries for the writer thread, falling back to local storage; False if both fail"""
+        for _ in range(2):
+            try:
+                # A failed write forces a new probe, so the retry lands locally when Firestore is down
+                self._commit_entries(user_id, pending)
+                self._forget_unwritten(user_id, pending)
+                return True
+            except Exception:
+                self._firestore_failed()
+                logger.warning("Background write for user %s failed", user_id, exc_info=True)
+        try:
+            # Kept locally like any write made while Firestore is unreachable
+            self._commit_entries_locally(user_id, pending)
+            self.invalidate_history(user_id)
+            self._forget_unwritten(user_id, pending)
             return True
         except Exception:
+            logger.exception("Local fallback write for user %s failed", user_id)
+            # Entries stay in _unwritten, so reads keep showing them until a retry lands
             return False
 
+    def flush_writes(self, timeout: Optional[float] = WRITE_FLUSH_TIMEOUT) -> bool:
+        """Wait until every entry handed to the background writer, retries included, is written"""
+        with self._retries_lock:
+            # Retry now rather than after the backoff
+            self._retries = [(0.0, seq, item) for _, seq, item in self._retries]
+        self._write_queue.put(None)
+        tasks = self._write_queue
+        with tasks.all_tasks_done:
+            done = tasks.all_tasks_done.wait_for(lambda: not tasks.unfinished_tasks, timeout)
+        if not done:
+            logger.error("Entries for %d writes were still unwritten after %ss", tasks.unfinished_tasks, timeout)
+        return done
+
     def save_mood_entry(self, user_id: str, mood_data: Dict[str, Any]) -> bool:
         """Save mood entry to storage"""
-        try:
-            if self.is_firestore_available():
-                # Save to Firestore
-                doc_ref = self.db.collection('users').document(user_id)
-                doc_ref.update({
-                    'mood_history': firestore.ArrayUnion([{
-                        **mood_data,
-                        'timestamp': datetime.now()
-                    }])
-                })
-            else:
-                # Save to local storage
-                data = self._load_local_data(user_id)
-                data['mood_history'].append({
-                    **mood_data,
-                    'timestamp': datetime.now().isoformat()
-                })
-                self._save_local_data(user_id, data)
-            return True
-        except Exception as e:
-            st.warning(f"Storage error: {str(e)}")
-            return False
+        entry = {**mood_data, 'timestamp': now_ns()}
+        return self._write_later(user_id, 'mood_history', [entry])
 
     def get_user_history(
         self, 
@@ -100,52 +546,158 @@ class StorageService:
             else:
                 # Get from local storage
                 data = self._load_local_data(user_id)
+            data = self._with_unwritten(user_id, data)
 
             # Apply filters
             if days or mood_filter:
-                data = self._filter_history(data, days, mood_filter)
+                data = self._filter_history(data, days, mood_filter, user_id)
             
             return data
         except Exception as e:
             st.warning(f"Error fetching history: {str(e)}")
             return self._load_local_data(user_id)
 
+    def get_cached_history(
+        self,
+        user_id: str,
+        days: Optional[int] = None,
+        mood_filter: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get user history, reading storage only after the user's data changed"""
+        return _cached_user_history(self, user_id, self.history_synced_at(user_id), days, mood_filter)
+
+    def get_focus_data(self, user_id: str) -> Dict[str, Any]:
+        """Get a user's focus sessions and totals, reading only those fields of the user document"""
+        try:
+            data = None
+            if self.is_firestore_available():
+                doc_ref = self.db.collection('users').document(user_id)
+                doc = doc_ref.get(field_paths=['focus_history', 'focus_stats'])
+                if doc.exists:
+                    data = doc.to_dict() or {}
+                    if data.get('focus_history') and not data.get('focus_stats'):
+                        # Backfill totals once so later increments start from the full history
+                        data['focus_stats'] = focus_stats_of(data['focus_history'])
+                        doc_ref.set({'focus_stats': data['focus_stats']}, merge=True)
+            if data is None:
+                data = self._load_local_data(user_id)
+            data = self._with_unwritten(user_id, data)
+            return {
+                'focus_history': data.get('focus_history', []),
+                'focus_stats': data.get('focus_stats'),
+            }
+        except Exception as e:
+            st.warning(f"Error fetching focus history: {str(e)}")
+            return {'focus_history': [], 'focus_stats': None}
+
+    def get_cached_focus_history(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        query: Optional[str] = None
+    ) -> List[Dict]:
+        """Get focus sessions matching a status and every word of query, via the cached index"""
+        index = _cached_focus_index(self, user_id, self.history_synced_at(user_id))
+        hits = None
+        if status:
+            hits = set(index['status'].get(status.lower(), ()))
+        for token in task_tokens(query):
+            matches = index['tokens'].get(token, set())
+            hits = matches if hits is None else hits & matches
+        if hits is None:
+            return index['sessions']
+        return [index['sessions'][i] for i in sorted(hits)]
+
+    def get_cached_focus_stats(self, user_id: str) -> Dict[str, Any]:
+        """Get a user's finished-session count and total minutes without summing the history"""
+        return _cached_focus_index(self, user_id, self.history_synced_at(user_id))['stats']
+
+    def _read_task_data(self, user_id: str) -> List[Dict]:
+        """A user's tasks, reading only that field of the user document; raises on failure"""
+        if self.is_firestore_available():
+            doc = self.db.collection('users').document(user_id).get(field_paths=['task_history'])
+            if doc.exists:
+                return (doc.to_dict() or {}).get('task_history', [])
+        return self._load_local_data(user_id).get('task_history', [])
+
+    def get_task_data(self, user_id: str) -> List[Dict]:
+        """Get a user's tasks, reading only that field of the user document"""
+        try:
+            return self._read_task_data(user_id)
+        except Exception as e:
+            st.warning(f"Error fetching tasks: {str(e)}")
+            return []
+
+    def prefetch_tasks(self, user_id: str) -> Future:
+        """Start filling the task cache for the user's current data in the background"""
+        return _PREFETCH_POOL.submit(_prefetch_tasks, self, user_id, self.history_synced_at(user_id))
+
+    def get_cached_tasks(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> List[Dict]:
+        """Get a user's tasks, newest first, optionally filtered by status and priority"""
+        try:
+            groups = _cached_tasks(self, user_id, self.history_synced_at(user_id))
+        except Exception as e:
+            st.warning(f"Error fetching tasks: {str(e)}")
+            return []
+        return groups.get((status.lower() if status else None, priority or None), [])
+
+    def list_tasks(
+        self,
+        user_id: str,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        limit: int = 50,
+        cursor: int = 0
+    ) -> Tuple[List[Dict], Optional[int]]:
+        """Get one page of tasks and the cursor of the next page, or None on the last page"""
+        tasks = self.get_cached_tasks(user_id, status, priority)
+        end = cursor + limit
+        return tasks[cursor:end], end if end < len(tasks) else None
+
+    def history_synced_at(self, user_id: str) -> float:
+        """Timestamp of the user's last write, for keying caches derived from their history"""
+        return self._history_synced_at.setdefault(user_id, time.time())
+
+    def invalidate_history(self, user_id: str):
+        """Make the next get_cached_history call for a user read fresh data"""
+        self._history_synced_at[user_id] = time.time()
+
     def _filter_history(
         self, 
         data: Dict[str, Any], 
         days: Optional[int], 
-        mood_filter: Optional[str]
+        mood_filter: Optional[str],
+        user_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Apply filters to history data"""
+        """Apply filters to history data; with user_id, day windows reuse the user's timestamp index"""
         filtered_data = data.copy()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days) if days else None
         
         for history_type in ['mood_history', 'focus_history', 'task_history']:
             if history_type in filtered_data:
                 history = filtered_data[history_type]
                 
-                # Filter by days
-                if days:
-                    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-                    def parse_timestamp(ts):
-                        if isinstance(ts, datetime):
-                            if ts.tzinfo is None:
-                                return ts.replace(tzinfo=timezone.utc)
-                            return ts.astimezone(timezone.utc)
-                        elif isinstance(ts, str):
-                            try:
-                                dt = datetime.fromisoformat(ts)
-                                if dt.tzinfo is None:
-                                    return dt.replace(tzinfo=timezone.utc)
-                                return dt.astimezone(timezone.utc)
-                            except Exception:
-                                return None
-                        else:
-                            return None
-
+                # Filter by days; each timestamp is parsed once, and
+                # to_utc_datetime memoizes it across calls
+                timestamps = None
+                if cutoff is not None and user_id:
+                    timestamps = self._sorted_timestamps(user_id, history_type, history)
+                if timestamps is not None:
+                    # Append-only histories are in timestamp order, so the window is a tail slice
+                    history = history[bisect.bisect_left(timestamps, cutoff):]
+                elif cutoff is not None and len(history) > VECTORIZE_MIN_ENTRIES:
+                    # Long histories parse every timestamp in one vectorized pass
+                    recent = (to_utc_series([e.get('timestamp') for e in history]) >= cutoff).to_numpy()
+                    history = [entry for entry, keep in zip(history, recent) if keep]
+                elif cutoff is not None:
                     history = [
                         entry for entry in history
-                        if (parse_timestamp(entry.get('timestamp')) is not None and
-                            parse_timestamp(entry.get('timestamp')) >= cutoff)
+                        if (ts := to_utc_datetime(entry.get('timestamp'))) is not None and ts >= cutoff
                     ]
                 
                 # Filter by mood
@@ -159,6 +711,15 @@ class StorageService:
         
         return filtered_data
 
+    def _sorted_timestamps(self, user_id: str, history_type: str, history: List[Dict]) -> Optional[List]:
+        """sorted_timestamps(history), computed once per version of the user's data"""
+        synced_at = self.history_synced_at(user_id)
+        cached = self._timestamp_index.get((user_id, history_type))
+        if cached is None or cached[:2] != (synced_at, len(history)):
+            cached = (synced_at, len(history), sorted_timestamps(history))
+            self._timestamp_index[(user_id, history_type)] = cached
+        return cached[2]
+
     def update_user_settings(self, user_id: str, settings: Dict[str, Any]) -> bool:
         """Update user settings"""
         try:
@@ -166,128 +727,170 @@ class StorageService:
                 self.db.collection('users').document(user_id).update({
                     'settings': settings
                 })
+                self._firestore_succeeded()
             else:
-                data = self._load_local_data(user_id)
-                data['settings'] = settings
-                self._save_local_data(user_id, data)
+                with self._local_lock(user_id):
+                    data = self._load_local_data(user_id)
+                    data['settings'] = settings
+                    self._save_local_data(user_id, data)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
+            self._firestore_failed()
             st.warning(f"Error updating settings: {str(e)}")
             return False
 
     def save_task_entry(self, user_id: str, task_data: Dict[str, Any]) -> bool:
         """Save task entry to storage"""
+        return self.save_tasks_bulk(user_id, [task_data])
+
+    def save_tasks_bulk(self, user_id: str, tasks: List[Dict[str, Any]]) -> bool:
+        """Append several task entries in one commit"""
+        if not tasks:
+            return True
         try:
             if self.is_firestore_available():
-                doc_ref = self.db.collection('users').document(user_id)
-                doc_ref.update({
-                    'task_history': firestore.ArrayUnion([task_data])
+                batch = self.db.batch()
+                batch.update(self.db.collection('users').document(user_id), {
+                    'task_history': firestore.ArrayUnion(list(tasks))
                 })
+                batch.commit()
+                self._firestore_succeeded()
             else:
-                data = self._load_local_data(user_id)
-                data['task_history'].append(task_data)
-                self._save_local_data(user_id, data)
+                with self._local_lock(user_id):
+                    self._local.append(user_id, 'task_history', tasks)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
+            self._firestore_failed()
             st.warning(f"Storage error: {str(e)}")
             return False
 
-    def update_task_status(self, user_id: str, task: Dict[str, Any]) -> bool:
+    def update_task_status(
+        self,
+        user_id: str,
+        task: Dict[str, Any],
+        previous: Optional[Dict[str, Any]] = None
+    ) -> bool:
         """Update task status in storage"""
+        if previous is None:
+            # The last-read copy is what ArrayRemove has to match
+            previous = next(
+                (t for t in self.get_cached_tasks(user_id) if t.get('id') == task['id']), None
+            )
+        if previous is not None:
+            return self.update_tasks_bulk(user_id, [(previous, task)])
         try:
             if self.is_firestore_available():
                 doc_ref = self.db.collection('users').document(user_id)
-                doc = doc_ref.get()
+                doc = doc_ref.get(field_paths=['task_history'])
                 if doc.exists:
                     tasks = doc.to_dict().get('task_history', [])
                     tasks = [t if t.get('id') != task['id'] else task for t in tasks]
                     doc_ref.update({'task_history': tasks})
             else:
-                data = self._load_local_data(user_id)
-                data['task_history'] = [t if t.get('id') != task['id'] else task 
-                                      for t in data['task_history']]
-                self._save_local_data(user_id, data)
+                with self._local_lock(user_id):
+                    data = self._load_local_data(user_id)
+                    data['task_history'] = [t if t.get('id') != task['id'] else task 
+                                          for t in data['task_history']]
+                    self._save_local_data(user_id, data)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
+            self._firestore_failed()
             st.warning(f"Error updating task: {str(e)}")
             return False
 
-    def delete_task(self, user_id: str, task: Dict[str, Any]) -> bool:
-        """Delete task from storage"""
+    def update_tasks_bulk(self, user_id: str, changes: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> bool:
+        """Replace several stored tasks in one commit; changes pairs each stored task with its update"""
+        if not changes:
+            return True
         try:
             if self.is_firestore_available():
+                # Swap the stored entries without reading the whole array back
                 doc_ref = self.db.collection('users').document(user_id)
-                doc = doc_ref.get()
-                if doc.exists:
-                    tasks = doc.to_dict().get('task_history', [])
-                    tasks = [t for t in tasks if t.get('id') != task['id']]
-                    doc_ref.update({'task_history': tasks})
+                batch = self.db.batch()
+                batch.update(doc_ref, {'task_history': firestore.ArrayRemove([old for old, _ in changes])})
+                batch.update(doc_ref, {'task_history': firestore.ArrayUnion([new for _, new in changes])})
+                batch.commit()
+                self._firestore_succeeded()
             else:
-                data = self._load_local_data(user_id)
-                data['task_history'] = [t for t in data['task_history'] 
-                                      if t.get('id') != task['id']]
-                self._save_local_data(user_id, data)
+                updated = {new.get('id'): new for _, new in changes}
+                with self._local_lock(user_id):
+                    data = self._load_local_data(user_id)
+                    data['task_history'] = [updated.get(t.get('id'), t) for t in data['task_history']]
+                    self._save_local_data(user_id, data)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
-            st.warning(f"Error deleting task: {str(e)}")
+            self._firestore_failed()
+            st.warning(f"Error updating tasks: {str(e)}")
             return False
 
-    def save_focus_entry(self, user_id: str, focus_data: Dict[str, Any]) -> bool:
-        """Save focus session entry to storage"""
+    def delete_task(self, user_id: str, task: Dict[str, Any]) -> bool:
+        """Delete task from storage"""
+        return self.delete_tasks(user_id, [task])
+
+    def delete_tasks(self, user_id: str, tasks: List[Dict[str, Any]]) -> bool:
+        """Remove several task entries in one commit"""
+        if not tasks:
+            return True
         try:
             if self.is_firestore_available():
-                doc_ref = self.db.collection('users').document(user_id)
-                doc_ref.update({
-                    'focus_history': firestore.ArrayUnion([focus_data])
+                batch = self.db.batch()
+                batch.update(self.db.collection('users').document(user_id), {
+                    'task_history': firestore.ArrayRemove(list(tasks))
                 })
+                batch.commit()
+                self._firestore_succeeded()
             else:
-                data = self._load_local_data(user_id)
-                data['focus_history'].append(focus_data)
-                self._save_local_data(user_id, data)
+                removed = {t.get('id') for t in tasks}
+                with self._local_lock(user_id):
+                    data = self._load_local_data(user_id)
+                    data['task_history'] = [t for t in data['task_history'] 
+                                          if t.get('id') not in removed]
+                    self._save_local_data(user_id, data)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
-            st.warning(f"Storage error: {str(e)}")
+            self._firestore_failed()
+            st.warning(f"Error deleting task: {str(e)}")
             return False
 
+    def save_focus_entry(self, user_id: str, focus_data: Dict[str, Any]) -> bool:
+        """Save focus session entry to storage, keeping running totals for finished sessions"""
+        return self._write_later(user_id, 'focus_history', [focus_data])
+
     def save_schedule(self, user_id: str, schedule_data: Dict[str, Any]) -> bool:
         """Save generated schedule to storage"""
-        try:
-            if self.is_firestore_available():
-                doc_ref = self.db.collection('users').document(user_id)
-                doc_ref.update({
-                    'schedules': firestore.ArrayUnion([schedule_data])
-                })
-            else:
-                data = self._load_local_data(user_id)
-                if 'schedules' not in data:
-                    data['schedules'] = []
-                data['schedules'].append(schedule_data)
-                self._save_local_data(user_id, data)
-            return True
-        except Exception as e:
-            st.warning(f"Error saving schedule: {str(e)}")
-            return False
+        return self._write_later(user_id, 'schedules', [schedule_data])
 
     def cleanup_old_data(self, user_id: str) -> bool:
         """Clean up data older than 1 year"""
         try:
             if self.is_firestore_available():
+                history_types = ['mood_history', 'focus_history', 'task_history', 'schedules']
                 doc_ref = self.db.collection('users').document(user_id)
-                doc = doc_ref.get()
+                doc = doc_ref.get(field_paths=history_types)
                 if doc.exists:
-                    data = doc.to_dict()
+                    data = doc.to_dict() or {}
                     cutoff_date = datetime.now(timezone.utc) - timedelta(days=365)
+                    updates = {}
                     
                     # Clean up each history type
-                    for history_type in ['mood_history', 'focus_history', 'task_history', 'schedules']:
+                    for history_type in history_types:
                         if history_type in data:
-                            data[history_type] = [
+                            kept = [
                                 entry for entry in data[history_type]
-                                if datetime.fromisoformat(entry['timestamp']) > cutoff_date
+                                if (ts := to_utc_datetime(entry.get('timestamp'))) is None or ts > cutoff_date
                             ]
+                            if len(kept) < len(data[history_type]):
+                                updates[history_type] = kept
                     
-                    # Update document with cleaned data
-                    doc_ref.set(data)
+                    # Rewrite only the histories that lost entries
+                    if updates:
+                        doc_ref.update(updates)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
             st.warning(f"Error cleaning up old data: {str(e)}")
@@ -297,29 +900,15 @@ class StorageService:
         """Send OTP to user's email"""
         try:
             # Generate OTP
-            otp = ''.join(random.choices(string.digits, k=6))
+            otp = generate_otp()
             
-            # First try storing OTP locally if Firestore is not available
+            # Only the hash is stored; it survives restarts in Firestore or on disk
             otp_data = {
-                'otp': otp,
+                'otp_hash': hash_otp(email, otp),
                 'expires_at': (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat(),
                 'attempts': 0
             }
             
-            if self.is_firestore_available():
-                try:
-                    otp_ref = self.db.collection('otps').document(email)
-                    otp_ref.set(otp_data)
-                except Exception as e:
-                    st.warning(f"Firestore storage failed, using local storage: {str(e)}")
-                    self._save_local_data(f"otp_{email}", otp_data)
-            else:
-                self._save_local_data(f"otp_{email}", otp_data)
-            
-            # Email configuration
-            smtp_server = "smtp.gmail.com"
-            smtp_port = 587
-            
             try:
                 sender_email = st.secrets["EMAIL_ADDRESS"]
                 sender_password = st.secrets["EMAIL_PASSWORD"]
@@ -330,43 +919,19 @@ class StorageService:
                 if len(sender_password) != 16:
                     raise ValueError("App Password should be exactly 16 characters")
                 
-                msg = MIMEMultipart()
+                # Single HTML part, no multipart container needed
+                from email.mime.text import MIMEText
+                msg = MIMEText(OTP_EMAIL_HTML.format(otp=otp), 'html')
                 msg['From'] = sender_email
                 msg['To'] = email
-                msg['Subject'] = "MindSpace - Your Verification Code"
-                
-                # Simplified HTML template
-                html = f"""
-                <div style="padding: 20px; background-color: #f9f9f9;">
-                    <h2>Your MindSpace Verification Code</h2>
-                    <div style="font-size: 24px; padding: 20px; background-color: #ffffff; margin: 20px 0;">
-                        <strong>{otp}</strong>
-                    </div>
-                    <p>This code will expire in 10 minutes.</p>
-                </div>
-                """
+                msg['Subject'] = OTP_EMAIL_SUBJECT
                 
-                msg.attach(MIMEText(html, 'html'))
-                
-                # Detailed error handling for SMTP
-                try:
-                    with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
-                        server.starttls()
-                        st.info("Attempting to send verification code...")
-                        server.login(sender_email, sender_password)
-                        server.send_message(msg)
-                        st.success("Verification code sent successfully!")
-                    return otp
-                except smtplib.SMTPAuthenticationError:
-                    st.error("""Email authentication failed. Please check:
-                    1. Email address is correct
-                    2. App Password is correct (16 characters, no spaces)
-                    3. 2-Step Verification is enabled
-                    """)
-                except smtplib.SMTPException as smtp_error:
-                    st.error(f"SMTP error: {str(smtp_error)}")
-                except Exception as e:
-                    st.error(f"Failed to send email: {str(e)}")
+                # Store and deliver in the background so the form returns
+                # immediately; check_otp_delivery surfaces failures on a later rerun
+                st.session_state.otp_email_future = _EMAIL_POOL.submit(
+                    self._store_and_send_otp, email, otp_data, msg, sender_email, sender_password
+                )
+                return otp
             except Exception as e:
                 st.error(f"Email configuration error: {str(e)}")
             
@@ -375,8 +940,51 @@ class StorageService:
             st.error(f"Error in send_otp: {str(e)}")
             return None
 
+    def _store_otp(self, email: str, otp_data: Dict):
+        """Save an OTP record to Firestore, falling back to local storage"""
+        if self.is_firestore_available():
+            try:
+                self.db.collection('otps').document(email).set(otp_data)
+                return
+            except Exception:
+                pass
+        self._save_local_data(f"otp_{email}", otp_data)
+
+    def _store_and_send_otp(self, email: str, otp_data: Dict, msg, sender_email: str, sender_password: str):
+        """Background job: persist the OTP record, then email the code"""
+        self._store_otp(email, otp_data)
+        _smtp_connection.send_message(msg, sender_email, sender_password)
+
+    def check_otp_delivery(self) -> bool:
+        """Report a failed background OTP email, if any"""
+        future = st.session_state.get('otp_email_future')
+        if future is None or not future.done():
+            return True
+
+        error = future.exception()
+        if error is None:
+            return True
+
+        import smtplib
+
+        if isinstance(error, smtplib.SMTPAuthenticationError):
+            st.error("""Email authentication failed. Please check:
+            1. Email address is correct
+            2. App Password is correct (16 characters, no spaces)
+            3. 2-Step Verification is enabled
+            """)
+        elif isinstance(error, smtplib.SMTPException):
+            st.error(f"SMTP error: {str(error)}")
+        else:
+            st.error(f"Failed to send email: {str(error)}")
+        return False
+
     def verify_otp(self, email: str, otp: str) -> bool:
         """Verify OTP"""
+        # The record is written by the background send job; make sure it landed
+        future = st.session_state.get('otp_email_future')
+        if future is not None:
+            wait([future], timeout=OTP_SEND_TIMEOUT)
         try:
             # Try Firestore first
             if self.is_firestore_available():
@@ -392,7 +1000,7 @@ class StorageService:
                             st.error("Verification code has expired. Please request a new one.")
                             return False
                         
-                        if otp_data['otp'] == otp:
+                        if otp_matches(otp_data, email, otp):
                             # Clean up OTP document after successful verification
                             otp_ref.delete()
                             return True
@@ -412,9 +1020,9 @@ class StorageService:
                         st.error("Verification code has expired. Please request a new one.")
                         return False
                     
-                    if otp_data['otp'] == otp:
+                    if otp_matches(otp_data, email, otp):
                         # Clean up local OTP data
-                        self._save_local_data(f"otp_{email}", None)
+                        self._delete_local_data(f"otp_{email}")
                         return True
                     else:
                         st.error("Invalid verification code.")
@@ -431,43 +1039,47 @@ class StorageService:
         """Synchronize user data between local storage and Firestore"""
         try:
             if self.is_firestore_available():
-                # Get local data
-                local_data = self._load_local_data(user_id)
-                
-                # Get Firestore data
+                # The Firestore read runs while the local files are loaded; the
+                # user's local lock keeps background writes out until the merge is saved
                 doc_ref = self.db.collection('users').document(user_id)
-                doc = doc_ref.get()
-                
-                if doc.exists:
-                    firestore_data = doc.to_dict()
-                    
-                    # Merge data (prefer Firestore data but include any local-only entries)
-                    merged_data = firestore_data.copy()
+                doc_future = _READ_POOL.submit(doc_ref.get)
+                with self._local_lock(user_id):
+                    local_data = self._load_local_data(user_id)
+                    doc = doc_future.result()
                     
-                    for history_type in ['mood_history', 'focus_history', 'task_history', 'chat_history']:
-                        local_entries = local_data.get(history_type, [])
-                        firestore_entries = firestore_data.get(history_type, [])
+                    if doc.exists:
+                        firestore_data = doc.to_dict()
                         
-                        # Create sets of entry IDs for comparison
-                        local_ids = {entry.get('id') for entry in local_entries if entry.get('id')}
-                        firestore_ids = {entry.get('id') for entry in firestore_entries if entry.get('id')}
+                        # Merge data (prefer Firestore data but include any local-only entries)
+                        merged_data = firestore_data.copy()
+                        updates = {}
                         
-                        # Add local entries that don't exist in Firestore
-                        new_entries = [entry for entry in local_entries 
-                                     if entry.get('id') and entry.get('id') not in firestore_ids]
+                        for history_type in ['mood_history', 'focus_history', 'task_history', 'chat_history']:
+                            firestore_entries = firestore_data.get(history_type, [])
+                            firestore_ids = {entry.get('id') for entry in firestore_entries}
+                            
+                            # Add local entries that don't exist in Firestore
+                            new_entries = [entry for entry in local_data.get(history_type, [])
+                                         if entry.get('id') and entry['id'] not in firestore_ids]
+                            
+                            if new_entries:
+                                merged_data[history_type] = firestore_entries + new_entries
+                                updates[history_type] = firestore.ArrayUnion(new_entries)
                         
-                        if new_entries:
-                            merged_data[history_type] = firestore_entries + new_entries
-                            # Update Firestore with merged data
-                            doc_ref.update({history_type: merged_data[history_type]})
-                    
-                    # Update local storage with merged data
-                    self._save_local_data(user_id, merged_data)
-                    
-                    return True
+                        # One write appends the local-only entries of every history type
+                        if updates:
+                            doc_ref.update(updates)
+                            self.invalidate_history(user_id)
+                        
+                        # Update local storage with merged data
+                        self._save_local_data(user_id, merged_data)
+                        
+                        return True
             return False
-        except Exception as e:
-            st.warning(f"Error syncing data: {str(e)}")
+        except Exception:
+            # Usually runs on the sync executor, where st.* output has nowhere to go;
+            # callers surface the False result
+            logger.exception("Syncing data for user %s failed", user_id)
             return False
 
     def update_user_profile(self, user_id: str, bio: str, interests: list):
@@ -479,12 +1091,19 @@ class StorageService:
                     'profile.interests': interests
                 })
             else:
-                data = self._load_local_data(user_id)
-                if 'profile' not in data:
-                    data['profile'] = {}
-                data['profile']['bio'] = bio
-                data['profile']['interests'] = interests
-                self._save_local_data(user_id, data)
+                with self._local_lock(user_id):
+                    data = self._load_local_data(user_id)
+                    if 'profile' not in data:
+                        data['profile'] = {}
+                    data['profile']['bio'] = bio
+                    data['profile']['interests'] = interests
+                    self._save_local_data(user_id, data)
+            if self._interest_index is not None:
+                self._buddy_profiles.setdefault(user_id, {'user_id': user_id, 'name': 'Anonymous'}).update(
+                    bio=bio, interests=interests
+                )
+                self._interest_index.set_interests(user_id, interests)
+            self.invalidate_history(user_id)
             return True
         except Exception as e:
             st.error(f"Error updating profile: {str(e)}")
@@ -504,22 +1123,63 @@ class StorageService:
             st.error(f"Error fetching profile: {str(e)}")
             return {}
 
+    def _get_interest_index(self) -> InterestIndex:
+        """Interest trie over all buddy profiles, rebuilt from Firestore when stale"""
+        with self._interest_index_lock:
+            if (self._interest_index is None
+                    or time.monotonic() - self._interest_index_built_at > INTEREST_INDEX_TTL):
+                index = InterestIndex()
+                profiles = {}
+                for doc in self.db.collection('users').select(['name', 'profile']).stream():
+                    data = doc.to_dict()
+                    profile = data.get('profile') or {}
+                    interests = profile.get('interests') or []
+                    profiles[doc.id] = {
+                        'user_id': doc.id,
+                        'name': data.get('name') or profile.get('name') or 'Anonymous',
+                        'bio': profile.get('bio', ''),
+                        'interests': interests
+                    }
+                    index.set_interests(doc.id, interests)
+                self._buddy_profiles = profiles
+                self._interest_index = index
+                self._interest_index_built_at = time.monotonic()
+            return self._interest_index
+
+    def find_buddies_by_interest(self, user_id: str, interests: list, limit: int = 20) -> List[Dict]:
+        """Profiles sharing an interest prefix, most shared interests first"""
+        try:
+            if not self.is_firestore_available():
+                return []
+            index = self._get_interest_index()
+            shared: Dict[str, int] = {}
+            for interest in interests:
+                for other_id in index.lookup(interest):
+                    shared[other_id] = shared.get(other_id, 0) + 1
+            shared.pop(user_id, None)
+            ranked = heapq.nlargest(limit, shared, key=shared.get)
+            return [self._buddy_profiles[other_id] for other_id in ranked if other_id in self._buddy_profiles]
+        except Exception as e:
+            st.error(f"Error finding buddies: {str(e)}")
+            return []
+
     def get_or_create_chat(self, user_id1: str, user_id2: str):
         """Get or create a chat between two users"""
         try:
             if self.is_firestore_available():
-                chats = self.db.collection('buddy_chats').where('participants', 'in', [
-                    [user_id1, user_id2], [user_id2, user_id1]
-                ]).stream()
-                for chat in chats:
-                    return chat.id
-                # Create new chat
-                chat_ref = self.db.collection('buddy_chats').document()
-                chat_ref.set({
-                    'participants': [user_id1, user_id2],
-                    'messages': []
-                })
-                return chat_ref.id
+                # The chat id is derived from the pair, so lookup is one keyed read
+                participants = sorted([user_id1, user_id2])
+                chat_key = ':'.join(participants)
+                chat_ref = self.db.collection('buddy_chats').document(chat_key)
+                self._alias_legacy_chats()
+                doc = chat_ref.get(field_paths=['participants', 'alias_of'])
+                if doc.exists:
+                    # Chats created before keyed ids live under their random id
+                    return (doc.to_dict() or {}).get('alias_of') or chat_key
+
+                # Create new chat; merging keeps a concurrent creator's messages
+                chat_ref.set({'participants': participants, 'migrated': True}, merge=True)
+                return chat_key
             else:
                 # Local fallback: not implemented for brevity
                 return None
@@ -527,18 +1187,42 @@ class StorageService:
             st.error(f"Error getting/creating chat: {str(e)}")
             return None
 
+    def _alias_legacy_chats(self):
+        """One-off migration: give each random-id chat a keyed document pointing at it"""
+        if self._legacy_chats_aliased:
+            return
+        with self._legacy_chats_lock:
+            if self._legacy_chats_aliased:
+                return
+            meta_ref = self.db.collection('meta').document('buddy_chats')
+            meta = meta_ref.get()
+            if not (meta.exists and (meta.to_dict() or {}).get('legacy_aliased')):
+                chats = self.db.collection('buddy_chats')
+                aliases = []
+                for chat in chats.select(['participants']).stream():
+                    participants = sorted((chat.to_dict() or {}).get('participants') or [])
+                    chat_key = ':'.join(participants)
+                    if len(participants) == 2 and chat.id != chat_key:
+                        aliases.append((chat_key, {'participants': participants, 'alias_of': chat.id}))
+                for start in range(0, len(aliases), FIRESTORE_BATCH_LIMIT):
+                    batch = self.db.batch()
+                    for chat_key, alias in aliases[start:start + FIRESTORE_BATCH_LIMIT]:
+                        batch.set(chats.document(chat_key), alias, merge=True)
+                    batch.commit()
+                meta_ref.set({'legacy_aliased': True}, merge=True)
+            self._legacy_chats_aliased = True
+
     def send_buddy_message(self, chat_id: str, sender_id: str, msg_type: str, content: str):
         """Send a message in a buddy chat"""
         try:
             if self.is_firestore_available():
+                # One small document per message; sending never rewrites the history
                 chat_ref = self.db.collection('buddy_chats').document(chat_id)
-                chat_ref.update({
-                    'messages': firestore.ArrayUnion([{
-                        'sender': sender_id,
-                        'type': msg_type,
-                        'content': content,
-                        'timestamp': datetime.now(timezone.utc).isoformat()
-                    }])
+                chat_ref.collection('messages').add({
+                    'sender': sender_id,
+                    'type': msg_type,
+                    'content': content,
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
                 return True
             else:
@@ -548,14 +1232,35 @@ class StorageService:
             st.error(f"Error sending message: {str(e)}")
             return False
 
-    def get_buddy_messages(self, chat_id: str):
-        """Get all messages in a buddy chat"""
+    def _migrate_legacy_messages(self, chat_ref):
+        """Move a chat's pre-subcollection message array into its messages subcollection, once"""
+        if chat_ref.id in self._migrated_chats:
+            return
+        doc = chat_ref.get(field_paths=['messages', 'migrated'])
+        data = (doc.to_dict() or {}) if doc.exists else {}
+        if doc.exists and not data.get('migrated'):
+            legacy = data.get('messages') or []
+            for start in range(0, len(legacy), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for i, message in enumerate(legacy[start:start + FIRESTORE_BATCH_LIMIT], start):
+                    # Fixed ids make a concurrent migration rewrite the same documents
+                    batch.set(chat_ref.collection('messages').document(f'legacy-{i:06d}'), message)
+                batch.commit()
+            chat_ref.update({'messages': firestore.DELETE_FIELD, 'migrated': True})
+        self._migrated_chats.add(chat_ref.id)
+
+    def get_buddy_messages(self, chat_id: str, limit: int = BUDDY_MESSAGE_LIMIT):
+        """Get the latest limit messages in a buddy chat, oldest first"""
         try:
             if self.is_firestore_available():
                 chat_ref = self.db.collection('buddy_chats').document(chat_id)
-                doc = chat_ref.get()
-                if doc.exists:
-                    return doc.to_dict().get('messages', [])
+                self._migrate_legacy_messages(chat_ref)
+                return [
+                    doc.to_dict() for doc in chat_ref.collection('messages')
+                    .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                    .limit(limit)
+                    .stream()
+                ][::-1]
             else:
                 # Local fallback: not implemented for brevity
                 return []
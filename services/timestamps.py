@@ -0,0 +1,41 @@
+import time
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+# History entries store timestamps as int64 nanoseconds since the epoch; older
+# entries may still hold ISO strings or Firestore datetimes, so readers accept all three
+
+def now_ns() -> int:
+    """Current time as epoch nanoseconds, the stored timestamp format"""
+    return time.time_ns()
+
+# History filters reparse the same entries on every rerun
+@lru_cache(maxsize=4096)
+def to_utc_datetime(ts) -> Optional[datetime]:
+    """Parse one stored timestamp into an aware UTC datetime, or None if unreadable"""
+    if isinstance(ts, bool):
+        return None
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts / 1e9, tz=timezone.utc)
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts)
+        except ValueError:
+            return None
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            return ts.replace(tzinfo=timezone.utc)
+        return ts.astimezone(timezone.utc)
+    return None
+
+def to_utc_series(values: Iterable):
+    """Vectorized parse of stored timestamps into a UTC datetime64 Series"""
+    import pandas as pd
+    raw = pd.Series(values, dtype=object)
+    nanos = pd.to_numeric(raw, errors='coerce')
+    parsed = pd.to_datetime(nanos, unit='ns', utc=True)
+    legacy = nanos.isna() & raw.notna()
+    if legacy.any():
+        parsed[legacy] = pd.to_datetime(raw[legacy], utc=True, format='ISO8601', errors='coerce')
+    return parsed
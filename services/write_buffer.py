@@ -0,0 +1,64 @@
+import atexit
+import threading
+from typing import Dict, Any, Tuple
+
+# Firestore rejects batches with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+class BatchedWriter:
+    """Buffer Firestore document updates and commit them in batches"""
+
+    def __init__(self, db, flush_interval: float = 2.0, max_pending: int = 400):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def update(self, collection: str, document_id: str, fields: Dict[str, Any]):
+        """Queue top-level field updates; later values for a field win"""
+        with self._lock:
+            self._pending.setdefault((collection, document_id), {}).update(fields)
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+
+    def pop(self, collection: str, document_id: str) -> Dict[str, Any]:
+        """Take the queued updates for one document so a caller can commit them itself"""
+        with self._lock:
+            return self._pending.pop((collection, document_id), {})
+
+    def flush(self):
+        """Commit all queued updates, re-queueing them if the commit fails"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or not self.db:
+            return
+
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), MAX_BATCH_SIZE):
+                batch = self.db.batch()
+                for (collection, document_id), fields in items[start:start + MAX_BATCH_SIZE]:
+                    doc_ref = self.db.collection(collection).document(document_id)
+                    batch.set(doc_ref, fields, merge=True)
+                batch.commit()
+        except Exception:
+            with self._lock:
+                for key, fields in pending.items():
+                    # Keep any newer values queued while the commit was running
+                    self._pending[key] = {**fields, **self._pending.get(key, {})}
+            raise
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Updates stay queued and are retried on the next tick
+                pass